@@ -1,6 +1,7 @@
 import { createClient } from '@supabase/supabase-js';
 import { pipeline } from '@huggingface/transformers';
 import * as dotenv from 'dotenv';
+import { normalizeText } from './normalize.js';
 
 // Load environment variables
 dotenv.config();
@@ -37,7 +38,7 @@ async function processRows(classifier) {
 			console.log(`Processing row ${row.id}...`);
 
 			// Generate embedding
-			const output = await classifier(row.ocr_result, {
+			const output = await classifier(normalizeText(row.ocr_result), {
 				pooling: 'mean',
 				normalize: true
 			});
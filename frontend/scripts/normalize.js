@@ -0,0 +1,25 @@
+import { readFileSync } from 'node:fs';
+
+// Same clean-up rules the Python corpus build uses (processing/normalize.py),
+// compiled into one alternation with a named group per rule
+const normalizeRules = JSON.parse(
+	readFileSync(new URL('../../processing/normalize-rules.json', import.meta.url), 'utf-8')
+);
+const normalizePattern = new RegExp(
+	normalizeRules.rules.map((rule) => `(?<${rule.name}>${rule.pattern})`).join('|'),
+	`g${normalizeRules.flags}`
+);
+const normalizeReplacements = Object.fromEntries(
+	normalizeRules.rules.map((rule) => [rule.name, rule.replacement])
+);
+
+export function normalizeText(text) {
+	// Line endings first, as normalize.py does, so the rules only ever see \n
+	const cleaned = text.replace(/\r\n?/g, '\n').replace(normalizePattern, (...args) => {
+		const groups = args[args.length - 1];
+		const rule = Object.keys(groups).find((name) => groups[name] !== undefined);
+		return normalizeReplacements[rule];
+	});
+	// Not trim(), whose idea of whitespace differs from Python's strip()
+	return cleaned.replace(/^[ \t\n]+|[ \t\n]+$/g, '') + '\n';
+}
@@ -0,0 +1,74 @@
+import random
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from bench.mocks import WORDS
+
+# Synthetic stand-ins for the NARA PDFs: image-only pages of typewritten-looking
+# text, a mix of page sizes and type sizes, some photos and blank pages, so the
+# render, OCR and upload stages see roughly the same kind of work.
+
+SCAN_DPI = 150
+LETTER = (8.5, 11)
+LEGAL = (8.5, 14)
+
+
+def load_font(size: int):
+    try:
+        return ImageFont.truetype('DejaVuSansMono.ttf', size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            # Pillow < 10.1 only has the fixed bitmap font
+            return ImageFont.load_default()
+
+
+def make_page(rng: random.Random) -> Image:
+    """One scanned-looking page"""
+    inches = LEGAL if rng.random() < 0.15 else LETTER
+    size = (int(inches[0] * SCAN_DPI), int(inches[1] * SCAN_DPI))
+    page = Image.new('L', size, color=rng.randint(225, 250))
+    draw = ImageDraw.Draw(page)
+
+    kind = rng.random()
+    if kind < 0.05:
+        # Blank or nearly blank sheet
+        return page
+    if kind < 0.12:
+        # A photo or map: a big block of noise
+        box = (size[0] // 8, size[1] // 6, size[0] * 7 // 8, size[1] * 2 // 3)
+        noise = Image.effect_noise((box[2] - box[0], box[3] - box[1]), 80)
+        page.paste(noise, box[:2])
+        return page
+
+    # Typescript, large type on some pages and small dense type on others
+    font_size = rng.choice([14, 18, 22, 26])
+    font = load_font(font_size)
+    line_height = int(font_size * rng.uniform(1.3, 1.8))
+    y = SCAN_DPI // 2
+    while y < size[1] - SCAN_DPI // 2:
+        words = ' '.join(rng.choices(WORDS, k=rng.randint(4, 12))).upper()
+        draw.text((SCAN_DPI // 2 + rng.randint(-4, 4), y), words, fill=rng.randint(10, 60), font=font)
+        y += line_height
+        if rng.random() < 0.1:
+            y += line_height
+    return page.filter(ImageFilter.GaussianBlur(0.6))
+
+
+def generate(output_dir: str, records: int, pages: int, seed: int = 0) -> list:
+    """Write `records` PDFs of about `pages` pages each; returns their paths"""
+    rng = random.Random(seed)
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for index in range(records):
+        count = max(1, int(rng.gauss(pages, pages / 4)))
+        images = [make_page(rng) for _ in range(count)]
+        path = output / f"bench-{seed}-{index:05d}.pdf"
+        images[0].save(path, 'PDF', save_all=True, append_images=images[1:], resolution=SCAN_DPI)
+        for image in images:
+            image.close()
+        paths.append(path)
+    return paths
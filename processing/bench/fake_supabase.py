@@ -0,0 +1,277 @@
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from types import SimpleNamespace
+
+# A SQLite stand-in for the parts of supabase-py's PostgREST query builder the
+# processing scripts use: select (with column lists, `alias:col->>key` JSON
+# paths and `name:table(cols)` embeds), insert, update, upsert, the eq/neq/is_/
+# like filters, order and range.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS record (
+    id TEXT PRIMARY KEY,
+    record_number TEXT,
+    pdf_link TEXT,
+    result_page INTEGER,
+    parent_page_num INTEGER,
+    num_pages INTEGER,
+    in_anything_llm INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS page (
+    id TEXT PRIMARY KEY,
+    parent_record_id TEXT,
+    page_number INTEGER,
+    ocr_result TEXT,
+    error INTEGER,
+    cloudinary TEXT,
+    embedding TEXT,
+    updated_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS page_by_record ON page (parent_record_id, page_number);
+"""
+
+BOOLEAN_COLUMNS = {'in_anything_llm', 'error'}
+JSON_COLUMNS = {'cloudinary', 'embedding'}
+
+EMBED = re.compile(r'^(?:(\w+):)?(\w+)\(([^)]*)\)$')
+JSON_PATH = re.compile(r'^(?:(\w+):)?(\w+)->>(\w+)$')
+
+
+class FakeStore:
+    """One SQLite database holding the record and page tables"""
+
+    def __init__(self, path: str = ':memory:'):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rows_returned = 0
+
+    def columns(self, table: str) -> list:
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+
+
+def encode(column: str, value):
+    if column in JSON_COLUMNS and value is not None:
+        return json.dumps(value)
+    if column in BOOLEAN_COLUMNS and value is not None:
+        return int(bool(value))
+    return value
+
+
+def decode(column: str, value):
+    if column in JSON_COLUMNS and value is not None:
+        return json.loads(value)
+    if column in BOOLEAN_COLUMNS and value is not None:
+        return bool(value)
+    return value
+
+
+class Query:
+    def __init__(self, store: FakeStore, table: str):
+        self.store = store
+        self.table = table
+        self.action = None
+        self.payload = None
+        self.columns = ['*']
+        self.filters = []
+        self.ordering = []
+        self.bounds = None
+        self.on_conflict = 'id'
+
+    # Builders
+
+    def select(self, *columns):
+        self.action = 'select'
+        self.columns = [c.strip() for column in columns for c in split_columns(column)] or ['*']
+        return self
+
+    def insert(self, rows):
+        self.action = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', **kwargs):
+        self.action = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, values: dict):
+        self.action = 'update'
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((f'{column} = ?', encode(column, value)))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append((f'{column} != ?', encode(column, value)))
+        return self
+
+    def in_(self, column, values):
+        values = tuple(encode(column, value) for value in values)
+        self.filters.append((f"{column} IN ({','.join('?' * len(values)) or 'NULL'})", values))
+        return self
+
+    def like(self, column, pattern):
+        self.filters.append((f'{column} LIKE ?', pattern.replace('*', '%')))
+        return self
+
+    def is_(self, column, value):
+        if value in (None, 'null'):
+            self.filters.append((f'{column} IS NULL', None))
+        else:
+            self.filters.append((f'{column} = ?', encode(column, value in (True, 'true'))))
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.ordering.append(f"{column} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def range(self, start: int, end: int):
+        self.bounds = (start, end)
+        return self
+
+    def limit(self, count: int):
+        self.bounds = (0, count - 1)
+        return self
+
+    # Execution
+
+    def _where(self):
+        clauses = [clause for clause, _ in self.filters]
+        params = []
+        for clause, value in self.filters:
+            if '?' in clause:
+                params.extend(value if isinstance(value, tuple) else (value,))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def execute(self):
+        with self.store.lock:
+            self.store.requests += 1
+            data = getattr(self, f'_{self.action}')()
+            self.store.conn.commit()
+            self.store.rows_returned += len(data)
+        return SimpleNamespace(data=data, count=len(data))
+
+    def _select(self):
+        where, params = self._where()
+        sql = f'SELECT * FROM {self.table}{where}'
+        if self.ordering:
+            sql += ' ORDER BY ' + ', '.join(self.ordering)
+        if self.bounds:
+            sql += f' LIMIT {self.bounds[1] - self.bounds[0] + 1} OFFSET {self.bounds[0]}'
+        rows = self.store.conn.execute(sql, params).fetchall()
+        return [self._project(dict(row)) for row in rows]
+
+    def _project(self, row: dict) -> dict:
+        result = {}
+        for column in self.columns:
+            if column == '*':
+                result.update({key: decode(key, value) for key, value in row.items()})
+                continue
+
+            embed = EMBED.match(column)
+            if embed:
+                alias, table, fields = embed.groups()
+                parent = self.store.conn.execute(
+                    f'SELECT * FROM {table} WHERE id = ?', (row.get(f'parent_{table}_id'),)
+                ).fetchone()
+                wanted = [field.strip() for field in fields.split(',') if field.strip()]
+                result[alias or table] = None if parent is None else {
+                    key: decode(key, parent[key]) for key in (wanted or parent.keys())
+                }
+                continue
+
+            path = JSON_PATH.match(column)
+            if path:
+                alias, source, key = path.groups()
+                value = decode(source, row.get(source)) or {}
+                found = value.get(key) if isinstance(value, dict) else None
+                result[alias or key] = None if found is None else str(found)
+                continue
+
+            alias, _, name = column.rpartition(':')
+            result[alias or name] = decode(name, row.get(name))
+        return result
+
+    def _insert(self):
+        inserted = []
+        for row in self.payload:
+            row = {'id': str(uuid.uuid4()), **row}
+            columns = list(row)
+            self.store.conn.execute(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [encode(column, row[column]) for column in columns]
+            )
+            inserted.append(row)
+        return inserted
+
+    def _upsert(self):
+        written = []
+        for row in self.payload:
+            row = {'id': str(uuid.uuid4()), **row} if self.on_conflict == 'id' and 'id' not in row else row
+            columns = list(row)
+            updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != self.on_conflict)
+            self.store.conn.execute(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({self.on_conflict}) DO UPDATE SET {updates}",
+                [encode(column, row[column]) for column in columns]
+            )
+            written.append(row)
+        return written
+
+    def _update(self):
+        where, params = self._where()
+        columns = list(self.payload)
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        values = [encode(column, self.payload[column]) for column in columns]
+        ids = [row[0] for row in self.store.conn.execute(f'SELECT id FROM {self.table}{where}', params)]
+        self.store.conn.execute(f'UPDATE {self.table} SET {assignments}{where}', values + params)
+        return [{'id': row_id, **self.payload} for row_id in ids]
+
+    def _delete(self):
+        where, params = self._where()
+        ids = [row[0] for row in self.store.conn.execute(f'SELECT id FROM {self.table}{where}', params)]
+        self.store.conn.execute(f'DELETE FROM {self.table}{where}', params)
+        return [{'id': row_id} for row_id in ids]
+
+
+def split_columns(spec: str) -> list:
+    """Split 'a, b, rec:record(x, y)' on commas that aren't inside parentheses"""
+    parts, depth, current = [], 0, ''
+    for char in spec:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current += char
+    if current.strip():
+        parts.append(current)
+    return parts
+
+
+class FakeClient:
+    """Drop-in for supabase.Client backed by a FakeStore"""
+
+    def __init__(self, store: FakeStore):
+        self.store = store
+
+    def table(self, name: str) -> Query:
+        return Query(self.store, name)
+
+    from_ = table
@@ -0,0 +1,161 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from bench.fake_supabase import FakeClient, FakeStore
+
+# Local stand-ins for the remote services. install() puts fake `supabase`,
+# `google.generativeai` and `cloudinary` modules in sys.modules so the
+# processing scripts can be imported unchanged, and AnythingLLMServer is a real
+# HTTP server the upload script talks to through ANYTHING_LLM_URL.
+
+WORDS = (
+    "central intelligence agency memorandum subject reference cable station "
+    "director operations mexico city dallas november report source contact "
+    "file record routing secret review information office meeting request"
+).split()
+
+
+class Latency:
+    """Normally distributed delay with a floor of zero, in seconds"""
+
+    def __init__(self, mean: float, jitter: float = 0.0):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sleep(self):
+        delay = random.gauss(self.mean, self.jitter) if self.jitter else self.mean
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MockGemini:
+    """Stands in for genai.GenerativeModel with configurable latency and failures"""
+
+    def __init__(self, latency: Latency, error_rate: float = 0.0, empty_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, parts):
+        with self._lock:
+            self.calls += 1
+        self.latency.sleep()
+
+        roll = random.random()
+        if roll < self.error_rate:
+            raise RuntimeError("503 The model is overloaded. Please try again later.")
+        if roll < self.error_rate + self.empty_rate:
+            return SimpleNamespace(text='')
+
+        # Roughly as much text as a typed page holds
+        lines = [' '.join(random.choices(WORDS, k=10)).upper() for _ in range(random.randint(20, 45))]
+        return SimpleNamespace(text='```text\n' + '\n'.join(lines) + '\n```')
+
+
+class MockCloudinary:
+    """Stands in for cloudinary.uploader.upload"""
+
+    def __init__(self, latency: Latency, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.uploads = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def upload(self, path: str, public_id: str = None, **kwargs) -> dict:
+        size = os.path.getsize(path)
+        self.latency.sleep()
+        if random.random() < self.error_rate:
+            raise RuntimeError("Cloudinary upload failed: 500")
+        with self._lock:
+            self.uploads += 1
+            self.bytes += size
+        return {
+            'public_id': public_id or uuid.uuid4().hex,
+            'bytes': size,
+            'format': 'jpg',
+            'secure_url': f"https://res.cloudinary.invalid/{public_id}.jpg",
+        }
+
+
+class AnythingLLMServer:
+    """Minimal AnythingLLM API: document upload and workspace embedding updates"""
+
+    def __init__(self, latency: Latency, error_rate: float = 0.0, port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.documents = 0
+        self.embedded = 0
+        self.bytes = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.latency.sleep()
+                if random.random() < server.error_rate:
+                    return self._reply(500, {'error': 'mock failure'})
+
+                if self.path == '/api/v1/document/upload':
+                    server.documents += 1
+                    server.bytes += len(body)
+                    return self._reply(200, {'documents': [{'id': uuid.uuid4().hex}]})
+                if self.path.endswith('/update-embeddings'):
+                    server.embedded += len(json.loads(body or b'{}').get('adds', []))
+                    return self._reply(200, {'workspace': {}})
+                self._reply(404, {'error': 'not found'})
+
+            def _reply(self, status: int, payload: dict):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='mock-anythingllm', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+def install(store: FakeStore, gemini: MockGemini, cloudinary_mock: MockCloudinary):
+    """Register the fake client modules so `import supabase` etc. resolve to them"""
+    supabase_module = types.ModuleType('supabase')
+    supabase_module.Client = FakeClient
+    supabase_module.create_client = lambda url=None, key=None, *args, **kwargs: FakeClient(store)
+    sys.modules['supabase'] = supabase_module
+
+    genai = types.ModuleType('google.generativeai')
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = lambda name, *args, **kwargs: gemini
+    google = sys.modules.get('google') or types.ModuleType('google')
+    google.generativeai = genai
+    sys.modules['google'] = google
+    sys.modules['google.generativeai'] = genai
+
+    cloudinary = types.ModuleType('cloudinary')
+    uploader = types.ModuleType('cloudinary.uploader')
+    uploader.upload = cloudinary_mock.upload
+    cloudinary.config = lambda **kwargs: None
+    cloudinary.uploader = uploader
+    sys.modules['cloudinary'] = cloudinary
+    sys.modules['cloudinary.uploader'] = uploader
@@ -0,0 +1,222 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench import corpus
+from bench.fake_supabase import FakeClient, FakeStore
+from bench.mocks import AnythingLLMServer, Latency, MockCloudinary, MockGemini, install
+
+# End-to-end offline benchmark for the processing pipeline.
+#
+#   cd processing && python -m bench.run --records 20 --pages 8
+#
+# Generates a synthetic PDF corpus, seeds a SQLite stand-in for Supabase, swaps
+# in mock Gemini/Cloudinary/AnythingLLM services and then drives the real
+# gemini-page-ocr.py, make-pages.py and upload-to-anything-llm.py against them,
+# reporting throughput, peak RSS and per-stage latency.
+#
+#   python -m bench.run --stages workers,corpus,ingest --workers 4
+#
+# OCRs through ocr-worker.py instead: the pages are published to the ledger
+# broker and --workers worker processes, each with its own mock services
+# (the Supabase stand-in is a file they all share), lease and OCR them.
+
+PROCESSING_DIR = Path(__file__).resolve().parent.parent
+
+STAGES = {
+    'ocr': ('gemini-page-ocr', 'process_directory'),
+    # Special-cased in main(): publish, then run the worker processes
+    'workers': ('ocr-worker', 'publish'),
+    'corpus': ('make-pages', 'save_concatenated_pages'),
+    'ingest': ('upload-to-anything-llm', 'upload_pending_files'),
+}
+
+
+def seed_records(store: FakeStore, pdf_paths: list):
+    from PyPDF2 import PdfReader
+    from releases import release_url
+
+    client = FakeClient(store)
+    for path in pdf_paths:
+        with open(path, 'rb') as f:
+            num_pages = len(PdfReader(f).pages)
+        client.table('record').insert({
+            'record_number': path.stem,
+            'pdf_link': release_url(path.name),
+            'result_page': 1,
+            'parent_page_num': 1,
+            'num_pages': num_pages,
+        }).execute()
+
+
+def mock_services(store: FakeStore, args):
+    gemini = MockGemini(Latency(args.gemini_latency, args.gemini_jitter),
+                        args.gemini_error_rate, args.gemini_empty_rate)
+    cloudinary = MockCloudinary(Latency(args.upload_latency, args.upload_latency / 4), args.upload_error_rate)
+    install(store, gemini, cloudinary)
+    return gemini, cloudinary
+
+
+def worker_process(store_path: str, args) -> dict:
+    """One ocr-worker.py worker, run until the queue is empty; returns its counters"""
+    store = FakeStore(store_path)
+    gemini, cloudinary = mock_services(store, args)
+    ocr_worker = importlib.import_module('ocr-worker')
+    ocr_worker.Worker(ocr_worker.connect(), exit_when_empty=True).run()
+    return {'gemini_calls': gemini.calls, 'uploaded_bytes': cloudinary.bytes, 'db_requests': store.requests}
+
+
+def run_workers(store_path: str, args) -> dict:
+    """Publish every pending page, then OCR them with args.workers worker processes"""
+    ocr_worker = importlib.import_module('ocr-worker')
+    ocr_worker.publish(ocr_worker.connect())
+    # Spawned rather than forked, so each worker builds its own clients
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.workers) as pool:
+        counters = pool.starmap(worker_process, [(store_path, args)] * args.workers)
+    return {key: sum(counter[key] for counter in counters) for key in counters[0]}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the processing pipeline")
+    parser.add_argument('--records', type=int, default=10, help="number of synthetic PDFs")
+    parser.add_argument('--pages', type=int, default=8, help="mean pages per PDF")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="where to build the corpus (default: a temp dir)")
+    parser.add_argument('--stages', default='ocr,corpus,ingest',
+                        help=f"comma separated subset of {','.join(STAGES)}")
+    parser.add_argument('--gemini-latency', type=float, default=1.0)
+    parser.add_argument('--gemini-jitter', type=float, default=0.3)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.02)
+    parser.add_argument('--gemini-empty-rate', type=float, default=0.01)
+    parser.add_argument('--upload-latency', type=float, default=0.3)
+    parser.add_argument('--upload-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=2,
+                        help="worker processes for the workers stage")
+    parser.add_argument('--memory-budget-mb', type=int, default=0,
+                        help="MEMORY_BUDGET_MB for page renders (0: unlimited)")
+    parser.add_argument('--report', help="also write the report as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        sys.exit(f"Unknown stages: {', '.join(sorted(unknown))}")
+    if {'ocr', 'workers'} <= set(stages):
+        sys.exit("The ocr and workers stages OCR the same pages, pick one")
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='jfk-bench-')).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    report_path = Path(args.report).resolve() if args.report else None
+    os.chdir(workdir)
+    print(f"Benchmark working directory: {workdir}")
+
+    llm = AnythingLLMServer(Latency(args.llm_latency, args.llm_latency / 4), args.llm_error_rate).start()
+    os.environ.update({
+        'LEDGER_PATH': str(workdir / 'ledger.sqlite3'),
+        'ANYTHING_LLM_URL': llm.url,
+        'ANYTHING_LLM_AUTHORIZATION': 'bench',
+        'SUPABASE_URL': 'http://fake-supabase.invalid',
+        'SUPABASE_KEY': 'bench',
+        'MEMORY_BUDGET_MB': str(args.memory_budget_mb),
+    })
+    os.environ.setdefault('PROGRESS_INTERVAL', '0')
+    # Idle workers check back often, so the last pages don't wait on a poll
+    os.environ.setdefault('POLL_SECONDS', '0.5')
+
+    started = time.perf_counter()
+    pdf_paths = corpus.generate('downloaded-pdfs', args.records, args.pages, seed=args.seed)
+    print(f"Generated {len(pdf_paths)} PDFs in {time.perf_counter() - started:.1f}s")
+
+    store_path = str(workdir / 'supabase.sqlite3')
+    store = FakeStore(store_path)
+    seed_records(store, pdf_paths)
+    gemini, cloudinary = mock_services(store, args)
+
+    # Everything below imports the real scripts, which now see the fakes
+    sys.path.insert(0, str(PROCESSING_DIR))
+    from ledger import Ledger, sync_from_supabase
+    from metrics import metrics, peak_rss_mb
+    sync_from_supabase(Ledger(), FakeClient(store))
+
+    results = {}
+    workers = {}
+    for stage in stages:
+        module_name, function = STAGES[stage]
+        module = importlib.import_module(module_name)
+        requests_before = store.requests
+        started = time.perf_counter()
+        if stage == 'workers':
+            # Worker processes count their own requests against the shared store
+            workers = run_workers(store_path, args)
+            requests_before -= workers['db_requests']
+        else:
+            getattr(module, function)()
+        elapsed = time.perf_counter() - started
+        results[stage] = {
+            'seconds': round(elapsed, 2),
+            'db_requests': store.requests - requests_before,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+    pages = store.conn.execute('SELECT COUNT(*), SUM(error) FROM page').fetchone()
+    if 'ocr' in results:
+        results['ocr']['pages'] = pages[0]
+        results['ocr']['errored_pages'] = pages[1] or 0
+        results['ocr']['pages_per_sec'] = round(pages[0] / max(results['ocr']['seconds'], 1e-9), 2)
+        results['ocr']['gemini_calls'] = gemini.calls
+        results['ocr']['uploaded_mb'] = round(cloudinary.bytes / 1_000_000, 2)
+        from render import budget
+        results['ocr']['peak_bitmap_mb'] = round(budget.peak / 1_000_000, 1)
+    if 'workers' in results:
+        results['workers']['workers'] = args.workers
+        results['workers']['pages'] = pages[0]
+        results['workers']['errored_pages'] = pages[1] or 0
+        results['workers']['pages_per_sec'] = round(pages[0] / max(results['workers']['seconds'], 1e-9), 2)
+        results['workers']['gemini_calls'] = workers['gemini_calls']
+        results['workers']['uploaded_mb'] = round(workers['uploaded_bytes'] / 1_000_000, 2)
+    if 'corpus' in results:
+        written = len(list(Path('ocr-text').glob('*.txt'))) if Path('ocr-text').exists() else 0
+        results['corpus']['records'] = written
+        results['corpus']['records_per_sec'] = round(written / max(results['corpus']['seconds'], 1e-9), 2)
+    if 'ingest' in results:
+        results['ingest']['documents'] = llm.documents
+        results['ingest']['embedded'] = llm.embedded
+
+    report = {
+        'config': vars(args),
+        'stages': results,
+        'latency': metrics.snapshot()['latency'],
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_child_rss_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    llm.stop()
+
+    print()
+    for stage, result in results.items():
+        print(f"{stage:>8}  " + '  '.join(f"{key}={value}" for key, value in result.items()))
+    print()
+    for stage, latency in sorted(report['latency'].items()):
+        mean = latency['sum'] / latency['count'] if latency['count'] else 0
+        print(f"{stage:>8}  n={latency['count']}  mean={mean:.3f}s  p50<={latency['p50']}s  p95<={latency['p95']}s")
+    print(f"\npeak RSS {report['peak_rss_mb']} MB (largest child process {report['peak_child_rss_mb']} MB)")
+
+    if report_path:
+        report_path.write_text(json.dumps(report, indent=2))
+        print(f"Wrote {report_path}")
+
+
+if __name__ == "__main__":
+    main()
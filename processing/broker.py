@@ -0,0 +1,273 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from ledger import Ledger, OCR, UPLOAD, PENDING, LEASED, DONE, ERROR, DEFAULT_LEASE_SECONDS
+
+# Task queue for OCR workers spread over several machines (see ocr-worker.py).
+#
+# A coordinator publishes one task per (record, page) and any number of worker
+# processes lease, process and ack them. A task that isn't acked, or whose lease
+# isn't extended, within VISIBILITY_TIMEOUT seconds goes back on the queue, so
+# pages held by a crashed worker are picked up by the others. Two backends:
+#
+#   BROKER_URL unset, or a path    the SQLite job ledger itself, for workers
+#                                  on one machine; not on a network filesystem,
+#                                  which SQLite's WAL mode doesn't support
+#   BROKER_URL=redis://host:6379   Redis (needs the `redis` package), for
+#                                  workers on more than one machine
+#
+# Both also keep a per-minute counter shared by every worker, so that together
+# they stay under OCR_RATE_LIMIT Gemini requests a minute.
+
+BROKER_URL = os.getenv('BROKER_URL')
+VISIBILITY_TIMEOUT = float(os.getenv('VISIBILITY_TIMEOUT', DEFAULT_LEASE_SECONDS))
+
+# Leases a page gets before it's given up on and left for `recover`
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', 3))
+
+# Gemini requests per minute across every worker; 0 for no limit
+OCR_RATE_LIMIT = int(os.getenv('OCR_RATE_LIMIT', 0))
+
+
+class Task(NamedTuple):
+    record_number: str
+    page: int
+    record_id: str
+    pdf_link: Optional[str]
+
+
+class LedgerBroker:
+    """Broker on the ledger's own jobs table, leased with Ledger.lease()"""
+
+    def __init__(self, ledger: Ledger, stage: str = OCR):
+        self.ledger = ledger
+        self.stage = stage
+
+    def publish(self, tasks: Iterable[Task]) -> int:
+        tasks = list(tasks)
+        self.ledger.add_records({(task.record_number, task.record_id, task.pdf_link, None) for task in tasks})
+        self.ledger.add_jobs(self.stage, [(task.record_number, task.page) for task in tasks])
+        return len(tasks)
+
+    def lease(self, owner: str, limit: int = 1, seconds: float = VISIBILITY_TIMEOUT) -> List[Task]:
+        tasks = []
+        for record_number, page in self.ledger.lease(self.stage, owner, limit, seconds,
+                                                      max_attempts=MAX_ATTEMPTS):
+            record = self.ledger.get_record(record_number) or {}
+            tasks.append(Task(record_number, page, record.get('record_id'), record.get('pdf_link')))
+        return tasks
+
+    def extend(self, task: Task, owner: str, seconds: float = VISIBILITY_TIMEOUT) -> bool:
+        return self.ledger.extend(task.record_number, self.stage, task.page, owner, seconds)
+
+    def ack(self, task: Task, uploaded: bool = False):
+        self.ledger.done(task.record_number, self.stage, task.page)
+        if uploaded:
+            self.ledger.done(task.record_number, UPLOAD, task.page)
+
+    def nack(self, task: Task, error: str) -> bool:
+        """Give a task back after a failure; True if it will be retried"""
+        if self.ledger.attempts(task.record_number, self.stage, task.page) < MAX_ATTEMPTS:
+            self.ledger.reset(task.record_number, self.stage, task.page)
+            return True
+        self.ledger.fail(task.record_number, self.stage, error, task.page)
+        return False
+
+    def release(self, task: Task):
+        """Give back a task that was leased but never started"""
+        self.ledger.reset(task.record_number, self.stage, task.page)
+
+    def collect(self) -> List[Tuple[Task, Optional[str], bool]]:
+        # Outcomes are written to the ledger as they happen
+        return []
+
+    def counts(self) -> Dict[str, int]:
+        return {state: self.ledger.count(self.stage, (state,)) for state in (PENDING, LEASED, DONE, ERROR)}
+
+    def take(self, name: str, limit: int, window: float = 60) -> float:
+        return self.ledger.take(name, limit, window)
+
+
+# Requeues expired leases, or gives up on them after ARGV[5] attempts like
+# nack() does, then moves up to ARGV[3] tasks from the pending list to the
+# leased sorted set, scored by when their lease runs out
+LEASE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, task in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], task)
+    redis.call('HDEL', KEYS[4], task)
+    if tonumber(redis.call('HGET', KEYS[3], task) or '0') < tonumber(ARGV[5]) then
+        redis.call('LPUSH', KEYS[1], task)
+    else
+        redis.call('HDEL', KEYS[3], task)
+        redis.call('HSET', KEYS[5], task, ARGV[6])
+        redis.call('RPUSH', KEYS[6], cjson.encode({task, ARGV[6], false}))
+    end
+end
+local leased = {}
+for i = 1, tonumber(ARGV[3]) do
+    local task = redis.call('LPOP', KEYS[1])
+    if not task then break end
+    redis.call('ZADD', KEYS[2], ARGV[2], task)
+    redis.call('HINCRBY', KEYS[3], task, 1)
+    redis.call('HSET', KEYS[4], task, ARGV[4])
+    table.insert(leased, task)
+end
+return leased
+"""
+
+EXTEND_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] and redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RedisBroker:
+    """Broker on Redis lists and sorted sets, for workers that can't share the ledger file
+
+    Lease expiry uses the Redis server's clock, so worker clocks don't matter.
+    Outcomes are also pushed to a results list, which the coordinator drains
+    into its ledger with collect().
+    """
+
+    def __init__(self, url: str, prefix: str = 'jfk:ocr'):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._lease = self.redis.register_script(LEASE_SCRIPT)
+        self._extend = self.redis.register_script(EXTEND_SCRIPT)
+
+    def key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def now(self) -> float:
+        seconds, microseconds = self.redis.time()
+        return seconds + microseconds / 1_000_000
+
+    @staticmethod
+    def encode(task: Task) -> str:
+        return json.dumps(list(task))
+
+    @staticmethod
+    def decode(member: str) -> Task:
+        return Task(*json.loads(member))
+
+    def publish(self, tasks: Iterable[Task], batch_size: int = 1000) -> int:
+        """Queue tasks that were never published before; returns how many"""
+        members = [self.encode(task) for task in tasks]
+        published = 0
+        for start in range(0, len(members), batch_size):
+            batch = members[start:start + batch_size]
+            pipe = self.redis.pipeline()
+            for member in batch:
+                pipe.sadd(self.key('tasks'), member)
+            new = [member for member, added in zip(batch, pipe.execute()) if added]
+            if new:
+                self.redis.rpush(self.key('pending'), *new)
+            published += len(new)
+        return published
+
+    def lease(self, owner: str, limit: int = 1, seconds: float = VISIBILITY_TIMEOUT) -> List[Task]:
+        now = self.now()
+        members = self._lease(
+            keys=[self.key('pending'), self.key('leased'), self.key('attempts'), self.key('owners'),
+                  self.key('errors'), self.key('results')],
+            args=[now, now + seconds, limit, owner, MAX_ATTEMPTS, 'Lease expired too many times'],
+        )
+        return [self.decode(member) for member in members]
+
+    def extend(self, task: Task, owner: str, seconds: float = VISIBILITY_TIMEOUT) -> bool:
+        extended = self._extend(
+            keys=[self.key('leased'), self.key('owners')],
+            args=[self.encode(task), owner, self.now() + seconds],
+        )
+        return bool(extended)
+
+    def ack(self, task: Task, uploaded: bool = False):
+        member = self.encode(task)
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.key('leased'), member)
+        pipe.hdel(self.key('owners'), member)
+        pipe.hdel(self.key('attempts'), member)
+        pipe.sadd(self.key('done'), member)
+        pipe.rpush(self.key('results'), json.dumps([member, None, uploaded]))
+        pipe.execute()
+
+    def nack(self, task: Task, error: str) -> bool:
+        """Give a task back after a failure; True if it will be retried"""
+        member = self.encode(task)
+        retry = int(self.redis.hget(self.key('attempts'), member) or 0) < MAX_ATTEMPTS
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.key('leased'), member)
+        pipe.hdel(self.key('owners'), member)
+        if retry:
+            pipe.rpush(self.key('pending'), member)
+        else:
+            pipe.hdel(self.key('attempts'), member)
+            pipe.hset(self.key('errors'), member, error)
+            pipe.rpush(self.key('results'), json.dumps([member, error, False]))
+        pipe.execute()
+        return retry
+
+    def release(self, task: Task):
+        """Give back a task that was leased but never started"""
+        member = self.encode(task)
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.key('leased'), member)
+        pipe.hdel(self.key('owners'), member)
+        pipe.lpush(self.key('pending'), member)
+        pipe.execute()
+
+    def collect(self, limit: int = 1000) -> List[Tuple[Task, Optional[str], bool]]:
+        """Take up to `limit` finished tasks as (task, error, uploaded)"""
+        pipe = self.redis.pipeline()
+        pipe.lrange(self.key('results'), 0, limit - 1)
+        pipe.ltrim(self.key('results'), limit, -1)
+        results = pipe.execute()[0]
+        collected = []
+        for result in results:
+            member, error, uploaded = json.loads(result)
+            collected.append((self.decode(member), error, uploaded))
+        return collected
+
+    def counts(self) -> Dict[str, int]:
+        pipe = self.redis.pipeline()
+        pipe.llen(self.key('pending'))
+        pipe.zcard(self.key('leased'))
+        pipe.scard(self.key('done'))
+        pipe.hlen(self.key('errors'))
+        return dict(zip((PENDING, LEASED, DONE, ERROR), pipe.execute()))
+
+    def take(self, name: str, limit: int, window: float = 60) -> float:
+        now = self.now()
+        started = int(now // window)
+        key = self.key(f"rate:{name}:{started}")
+        pipe = self.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, int(window) * 2)
+        if pipe.execute()[0] <= limit:
+            return 0
+        return (started + 1) * window - now
+
+
+def connect(url: str = BROKER_URL):
+    """Broker for a URL: redis:// and rediss:// use Redis, anything else is a ledger path"""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    if url:
+        return LedgerBroker(Ledger(url))
+    from clients import ledger
+    return LedgerBroker(ledger.get())
+
+
+def throttle(broker, limit: int = OCR_RATE_LIMIT):
+    """Wait until the shared per-minute Gemini budget has room for one more request"""
+    while limit:
+        wait = broker.take('gemini', limit)
+        if not wait:
+            return
+        time.sleep(wait)
@@ -0,0 +1,196 @@
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# `jfk-process` entry point. Each subcommand names the module that does the
+# work and that module is only imported once the subcommand runs, so heavy
+# dependencies (selenium, pdf2image, google.generativeai, ...) load only for
+# the commands that need them. Clients are built on first use (see clients.py).
+
+PROCESSING_DIR = Path(__file__).resolve().parent
+FRONTEND_DIR = PROCESSING_DIR.parent / 'frontend'
+
+
+def load(module_name: str):
+    """Import a processing script by file name, hyphens and all"""
+    if str(PROCESSING_DIR) not in sys.path:
+        sys.path.insert(0, str(PROCESSING_DIR))
+    return importlib.import_module(module_name)
+
+
+def start_metrics():
+    load('metrics').metrics.start()
+
+
+def cmd_scrape(args):
+    load('scrape-and-download').main()
+
+
+def cmd_sync_release(args):
+    start_metrics()
+    load('sync-release').sync(args.dry_run, args.verify, args.force, not args.no_process)
+
+
+def cmd_ocr(args):
+    load('gemini-page-ocr').main(args.directory)
+
+
+def cmd_coordinator(args):
+    start_metrics()
+    load('ocr-worker').coordinate(args.directory, args.watch)
+
+
+def cmd_worker(args):
+    start_metrics()
+    module = load('ocr-worker')
+    module.work(args.threads or module.OCR_WORKERS, args.exit_when_empty)
+
+
+def cmd_recover(args):
+    start_metrics()
+    module = load('just-cloudinary')
+    if args.reocr:
+        module.reocr_queued_pages(args.reocr)
+    elif args.upload_only:
+        module.process_error_pages()
+    else:
+        module.recover_error_pages()
+
+
+def cmd_score(args):
+    start_metrics()
+    load('score-ocr').main(args.limit, args.threshold, args.dry_run)
+
+
+def cmd_repair(args):
+    start_metrics()
+    load('repair').repair(dry_run=args.dry_run)
+
+
+def cmd_build_corpus(args):
+    start_metrics()
+    load('make-pages').save_concatenated_pages()
+
+
+def cmd_normalize(args):
+    load('normalize').normalize_corpus(args.directory, args.dry_run)
+
+
+def cmd_upload(args):
+    start_metrics()
+    load('upload-to-anything-llm').upload_pending_files()
+
+
+def cmd_embed(args):
+    # Page embeddings are computed by the frontend's transformers.js script
+    return subprocess.call(['node', 'scripts/generate-embeddings.js'], cwd=FRONTEND_DIR)
+
+
+def cmd_sync(args):
+    ledger = load('ledger')
+    clients = load('clients')
+    ledger.sync_from_supabase(clients.ledger.get(), clients.supabase.get())
+    ledger.print_status(clients.ledger.get())
+
+
+def cmd_snapshot(args):
+    snapshot = load('snapshot')
+    if args.action == 'export':
+        start_metrics()
+        snapshot.export(args.path or snapshot.SNAPSHOT_DIR, args.format)
+    snapshot.print_info(args.path or snapshot.SNAPSHOT_DIR)
+
+
+def cmd_status(args):
+    ledger = load('ledger')
+    # Read-only, so don't leave an empty ledger behind in the wrong directory
+    if not os.path.exists(ledger.LEDGER_PATH):
+        print(f"No ledger at {os.path.abspath(ledger.LEDGER_PATH)}; run 'jfk-process sync' "
+              "to create one, or set LEDGER_PATH")
+        return 1
+    ledger.print_status(ledger.Ledger())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='jfk-process', description="JFK files processing pipeline")
+    parser.add_argument('--from-snapshot', metavar='DIR',
+                        help="serve table scans from a local snapshot (see 'snapshot export') instead of Supabase")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('scrape', help="scrape the NARA release and download new PDFs")\
+        .set_defaults(handler=cmd_scrape)
+
+    sync_release = commands.add_parser('sync-release', help="download and process only new or changed records")
+    sync_release.add_argument('--dry-run', action='store_true', help="print the delta without downloading anything")
+    sync_release.add_argument('--verify', action='store_true',
+                              help="HEAD every listed file to catch changes under an unchanged URL")
+    sync_release.add_argument('--force', action='store_true', help="re-read the listing even if it looks unchanged")
+    sync_release.add_argument('--no-process', action='store_true', help="stop after downloading")
+    sync_release.set_defaults(handler=cmd_sync_release)
+
+    ocr = commands.add_parser('ocr', help="OCR downloaded PDFs with Gemini and upload page images")
+    ocr.add_argument('directory', nargs='?', default='downloaded-pdfs')
+    ocr.set_defaults(handler=cmd_ocr)
+
+    coordinator = commands.add_parser('coordinator', help="queue every page still to OCR for 'worker' processes")
+    coordinator.add_argument('directory', nargs='?', default='downloaded-pdfs')
+    coordinator.add_argument('--watch', action='store_true', help="report progress until the queue drains")
+    coordinator.set_defaults(handler=cmd_coordinator)
+
+    worker = commands.add_parser('worker', help="OCR pages from the queue; run as many as you like, on other hosts with a Redis BROKER_URL")
+    worker.add_argument('--threads', type=int, help="pages in flight (default: OCR_WORKERS)")
+    worker.add_argument('--exit-when-empty', action='store_true', help="stop once nothing is pending or leased")
+    worker.set_defaults(handler=cmd_worker)
+
+    recover = commands.add_parser('recover', help="retry pages that errored during OCR")
+    recover.add_argument('--upload-only', action='store_true', help="only re-upload the page images")
+    recover.add_argument('--reocr', type=int, metavar='N', help="re-OCR the N worst pages queued by 'score'")
+    recover.set_defaults(handler=cmd_recover)
+
+    score = commands.add_parser('score', help="score OCR quality and queue bad pages for re-OCR")
+    score.add_argument('--limit', type=int, help="queue at most this many pages, worst first")
+    score.add_argument('--threshold', type=float, help="minimum score (0 good, 1 bad) to queue a page")
+    score.add_argument('--dry-run', action='store_true', help="write the ranking without queueing anything")
+    score.set_defaults(handler=cmd_score)
+
+    repair = commands.add_parser('repair', help="fix links, record numbers and page counts")
+    repair.add_argument('--dry-run', action='store_true', help="print the fixes without writing them")
+    repair.set_defaults(handler=cmd_repair)
+
+    commands.add_parser('build-corpus', help="write ocr-text/*.txt for RAG")\
+        .set_defaults(handler=cmd_build_corpus)
+    normalize = commands.add_parser('normalize', help="re-normalize existing ocr-text/*.txt files in place")
+    normalize.add_argument('directory', nargs='?', default='ocr-text')
+    normalize.add_argument('--dry-run', action='store_true', help="report the savings without rewriting anything")
+    normalize.set_defaults(handler=cmd_normalize)
+    commands.add_parser('upload', help="upload corpus files to AnythingLLM")\
+        .set_defaults(handler=cmd_upload)
+    commands.add_parser('embed', help="compute page embeddings (frontend/scripts/generate-embeddings.js)")\
+        .set_defaults(handler=cmd_embed)
+    commands.add_parser('sync', help="seed the local job ledger from Supabase")\
+        .set_defaults(handler=cmd_sync)
+    snapshot = commands.add_parser('snapshot', help="export record and page to local Parquet/Arrow files")
+    snapshot.add_argument('action', nargs='?', default='info', choices=['export', 'info'])
+    snapshot.add_argument('--path', help="snapshot directory (default: SNAPSHOT_DIR or ./snapshot)")
+    snapshot.add_argument('--format', default='parquet', choices=['parquet', 'arrow'])
+    snapshot.set_defaults(handler=cmd_snapshot)
+    commands.add_parser('status', help="show pipeline progress from the local ledger")\
+        .set_defaults(handler=cmd_status)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    # Scripts read their settings from the environment at import time
+    from dotenv import load_dotenv
+    load_dotenv()
+    if args.from_snapshot:
+        os.environ['DB_SNAPSHOT'] = args.from_snapshot
+    return args.handler(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
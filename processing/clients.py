@@ -0,0 +1,62 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# Shared, lazily built clients. Importing this module is cheap: nothing is
+# constructed (and supabase/genai/cloudinary aren't imported) until a script
+# first touches one of these objects, so `jfk-process status` and dry runs
+# don't pay for clients they never use.
+
+load_dotenv()
+
+
+class Lazy:
+    """Proxy that builds its target on first attribute access, once, thread-safely"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _supabase():
+    from supabase import create_client
+    return create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+
+
+def _gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+    return genai.GenerativeModel('gemini-2.0-flash')
+
+
+def _cloudinary_uploader():
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET')
+    )
+    return cloudinary.uploader
+
+
+def _ledger():
+    from ledger import Ledger
+    return Ledger()
+
+
+supabase = Lazy(_supabase)
+gemini = Lazy(_gemini)
+cloudinary_uploader = Lazy(_cloudinary_uploader)
+ledger = Lazy(_ledger)
@@ -0,0 +1,173 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List
+from clients import supabase
+from metrics import timed
+
+# Shared Supabase access for table scans and bulk writes.
+#
+# PostgREST caps every response (1000 rows by default) without saying so, so a
+# plain select() on a big table quietly returns the first rows only. paged()
+# reads in ranges and keeps a few ranges in flight on the shared client's
+# keep-alive connections, so a scan is both complete and fast. Callers have to
+# name their columns; the cloudinary JSON alone is bigger than most pages' text.
+#
+# With DB_SNAPSHOT=<dir> (see snapshot.py) scans on the shared client are
+# served from a local snapshot instead. Writes always go to Supabase.
+
+PAGE_SIZE = int(os.getenv('DB_PAGE_SIZE', 1000))
+BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', 500))
+
+# Ranges fetched ahead of the one being consumed
+DB_READ_AHEAD = int(os.getenv('DB_READ_AHEAD', 4))
+
+# Longest list of values sent in one in.(...) filter, to keep URLs short
+IN_BATCH_SIZE = 200
+
+DB_SNAPSHOT = os.getenv('DB_SNAPSHOT')
+_snapshot = None
+
+
+def local_snapshot():
+    """The snapshot named by DB_SNAPSHOT, opened on first use"""
+    global _snapshot
+    if _snapshot is None:
+        from snapshot import Snapshot
+        _snapshot = Snapshot(DB_SNAPSHOT)
+        print(f"Reading tables from the {_snapshot.info['created_at']} snapshot in {DB_SNAPSHOT}")
+    return _snapshot
+
+
+def payload_bytes(rows: list) -> int:
+    """Approximate size of rows on the wire"""
+    return len(json.dumps(rows, default=str))
+
+
+def query(table: str, columns: List[str], filters: Dict[str, object], client=None):
+    """select() with equality filters; list, tuple and set values become in.(...)"""
+    builder = (client or supabase).table(table).select(*columns)
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            builder = builder.in_(column, list(value))
+        else:
+            builder = builder.eq(column, value)
+    return builder
+
+
+def paged(table: str, columns: List[str], order: str = 'id', client=None,
+          page_size: int = PAGE_SIZE, **filters) -> Iterator[dict]:
+    """Yield every matching row, reading PAGE_SIZE ranges a few at a time
+
+    The first range is read on its own so small lookups cost one request.
+    After that ranges are requested ahead of time and yielded in order; the
+    scan ends at the first short range and anything fetched past it is dropped.
+    `order` is a column or comma-separated columns, e.g. 'parent_record_id,id',
+    and should be unique so the ranges don't overlap or skip rows.
+    """
+    if DB_SNAPSHOT and client is None:
+        with timed('db_read', table=table, source='snapshot'):
+            rows = list(local_snapshot().rows(table, columns, order, **filters))
+        yield from rows
+        return
+
+    def fetch(start: int) -> list:
+        with timed('db_read', table=table, start=start) as span:
+            builder = query(table, columns, filters, client)
+            for column in order.split(','):
+                builder = builder.order(column)
+            rows = builder.range(start, start + page_size - 1).execute().data
+            span['rows'] = len(rows)
+            span['bytes'] = payload_bytes(rows)
+        return rows
+
+    rows = fetch(0)
+    yield from rows
+    if len(rows) < page_size:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, DB_READ_AHEAD)) as executor:
+        pending = deque()
+        next_start = page_size
+        while True:
+            while len(pending) < max(1, DB_READ_AHEAD):
+                pending.append(executor.submit(fetch, next_start))
+                next_start += page_size
+            rows = pending.popleft().result()
+            yield from rows
+            if len(rows) < page_size:
+                for future in pending:
+                    future.cancel()
+                return
+
+
+def fetch_all(table: str, columns: List[str], **kwargs) -> List[dict]:
+    """paged() as a list"""
+    return list(paged(table, columns, **kwargs))
+
+
+def select_in(table: str, columns: List[str], column: str, values: Iterable,
+              client=None, **filters) -> List[dict]:
+    """Rows whose `column` is any of `values`, in IN_BATCH_SIZE chunks"""
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        chunk = values[start:start + IN_BATCH_SIZE]
+        rows.extend(paged(table, columns, client=client, **filters, **{column: chunk}))
+    return rows
+
+
+def batches(rows: List[dict], size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    """Split rows into bulk-write batches that each share one set of keys
+
+    PostgREST rejects a bulk insert or upsert whose objects have different keys.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        for start in range(0, len(group), size):
+            yield group[start:start + size]
+
+
+def upsert(table: str, rows: List[dict], on_conflict: str = 'id', client=None,
+           batch_size: int = BATCH_SIZE) -> int:
+    """Bulk upsert in batches; returns the number of rows written"""
+    written = 0
+    for batch in batches(rows, batch_size):
+        with timed('db_write', table=table, rows=len(batch)) as span:
+            span['bytes'] = payload_bytes(batch)
+            (client or supabase).table(table).upsert(batch, on_conflict=on_conflict).execute()
+        written += len(batch)
+    return written
+
+
+def insert(table: str, rows: List[dict], client=None, batch_size: int = BATCH_SIZE) -> List[dict]:
+    """Bulk insert in batches; returns the inserted rows with their ids"""
+    inserted = []
+    for batch in batches(rows, batch_size):
+        with timed('db_write', table=table, rows=len(batch)) as span:
+            span['bytes'] = payload_bytes(batch)
+            inserted.extend((client or supabase).table(table).insert(batch).execute().data)
+    return inserted
+
+
+def update(table: str, updates: Dict[object, dict], client=None) -> int:
+    """PATCH rows by id, one request per distinct set of new values; returns the number of rows
+
+    Unlike upsert() this never inserts, so it can set a few columns without
+    tripping NOT NULL constraints on the ones it leaves out.
+    """
+    groups = {}
+    for row_id, values in updates.items():
+        groups.setdefault(json.dumps(values, sort_keys=True, default=str), (values, []))[1].append(row_id)
+    written = 0
+    for values, row_ids in groups.values():
+        for start in range(0, len(row_ids), IN_BATCH_SIZE):
+            chunk = row_ids[start:start + IN_BATCH_SIZE]
+            with timed('db_write', table=table, rows=len(chunk)) as span:
+                span['bytes'] = payload_bytes([values])
+                (client or supabase).table(table).update(values).in_('id', chunk).execute()
+            written += len(chunk)
+    return written
@@ -1,228 +1,182 @@
-import google.generativeai as genai
 from pathlib import Path
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from pdf2image import convert_from_path
-import uuid
-from typing import List, Tuple
-import time
+from typing import Callable, Optional, Tuple
 import PyPDF2
-import cloudinary
-import cloudinary.uploader
-import tempfile
-from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import ThreadPoolExecutor
 import threading
-from PIL import Image
-
-# Load environment variables
-load_dotenv()
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'), 
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
-
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
-
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-
-
-# Initialize Gemini model
-model = genai.GenerativeModel('gemini-2.0-flash')
+from clients import supabase, ledger
+from render import rendered_page, web_derivative, budget
+from ledger import OCR, UPLOAD, DONE, ERROR, default_owner
+from ocr import process_page, OCR_WORKERS
+from upload import upload_page_image
+from metrics import metrics, timed, peak_rss_mb
+import db
 
 def get_record_id(pdf_path: str) -> str:
-    """Get record ID from database based on filename"""
+    """Get record ID from the ledger, falling back to the database"""
     filename = Path(pdf_path).name
-    # Construct archives.gov URL
-    pdf_link = f"https://www.archives.gov/files/research/jfk/releases/2025/0318/{filename}"
-    
-    # Find record by pdf_link
-    result = supabase.table('record').select('id').eq('pdf_link', pdf_link).execute()
+    record_number = Path(pdf_path).stem
+    known = ledger.get_record(record_number)
+    if known and known['record_id']:
+        return known['record_id']
+
+    # Find record by number, or by file name for rows repair.py hasn't filled in,
+    # so it doesn't matter which release folder the PDF came from
+    result = supabase.table('record').select('id', 'pdf_link').eq('record_number', record_number).execute()
+    if not result.data:
+        result = supabase.table('record').select('id', 'pdf_link').like('pdf_link', f"%/{filename}").execute()
     
     if not result.data:
         raise Exception(f"No record found for PDF {filename}")
         
+    ledger.add_record(record_number, result.data[0]['id'], result.data[0]['pdf_link'])
     return result.data[0]['id']
 
-def get_processed_pages(record_id: str) -> set:
-    """Get set of page numbers already processed for this record"""
-    result = supabase.table('page').select('page_number').eq('parent_record_id', record_id).execute()
-    return {int(page['page_number']) for page in result.data}
+def get_processed_pages(record_id: str) -> dict:
+    """Get {page number: errored} for the pages already processed for this record"""
+    pages = db.paged('page', ['page_number', 'error'], parent_record_id=record_id)
+    return {
+        int(page['page_number']): bool(page.get('error'))
+        for page in pages
+        if page.get('page_number') is not None
+    }
 
-def upload_page_image(image: Image, filename: str) -> dict:
-    """Upload image to Cloudinary"""
-    thread_name = threading.current_thread().name
-    print(f"{thread_name}: Uploading {filename} to Cloudinary...")
+def queue_pdf(pdf_path: str) -> Tuple[str, str, int]:
+    """Register a PDF's pages as OCR jobs; returns (record ID, record number, page count)"""
+    # Get record ID based on PDF filename
+    record_id = get_record_id(pdf_path)
     
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-        try:
-            # Convert to RGB and save as JPEG with compression
-            rgb_image = image.convert('RGB')
-            rgb_image.save(tmp_file.name, 'JPEG', quality=85, optimize=True)
-            
-            # Check file size and reduce quality if needed
-            quality = 85
-            while os.path.getsize(tmp_file.name) > 10_000_000:  # 10MB limit
-                quality = int(quality * 0.9)  # Reduce quality by 10%
-                if quality < 20:  # Set minimum quality threshold
-                    print(f"{thread_name}: Could not reduce file size enough")
-                    return None
-                rgb_image.save(tmp_file.name, 'JPEG', quality=quality, optimize=True)
-            
-            # Upload the temporary file to Cloudinary
-            result = cloudinary.uploader.upload(tmp_file.name, public_id=filename)
-            print(f"{thread_name}: Cloudinary upload result: {result}")
-            
-            return result
-        finally:
-            # Clean up
-            rgb_image.close()
-            # Remove temporary file
-            if os.path.exists(tmp_file.name):
-                os.unlink(tmp_file.name)
+    # Check total pages
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        pdf_page_count = len(pdf_reader.pages)
+    
+    record_number = Path(pdf_path).stem
+    if not ledger.has_jobs(record_number, OCR):
+        # First time this ledger sees the record, so seed it from the database,
+        # with errored rows as errors like ledger.sync_from_supabase does
+        processed = get_processed_pages(record_id)
+        ledger.set_states(OCR, DONE, [(record_number, page) for page, errored in processed.items() if not errored])
+        ledger.set_states(OCR, ERROR, [(record_number, page) for page, errored in processed.items() if errored],
+                          error='OCR error in database')
+    ledger.add(record_number, OCR, range(1, pdf_page_count + 1))
+    return record_id, record_number, pdf_page_count
 
-def process_page(image: object, page_num: int, pdf_link: str, record_id: str) -> Tuple[int, str]:
-    """Process a single page with Gemini"""
-    prompt = f"""
-    Extract and transcribe the text content from this page.
-    Maintain the original structure but do not add any annotations.
-    """
+def ocr_page(pdf_path: str, page_num: int, record_id: str,
+             before_request: Optional[Callable[[], None]] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Render, OCR and upload one page; returns (its page row, error), with no row if it couldn't be rendered"""
+    thread_name = threading.current_thread().name
     
-    max_retries = 3
-    retry_delay = 1
+    # Render at a resolution picked from a low-DPI probe of the page,
+    # once there is room for the bitmap in the memory budget
+    with rendered_page(pdf_path, page_num) as (image, dpi):
+        if image is None:
+            print(f"{thread_name}: Failed to convert page {page_num}")
+            return None, "Failed to convert page"
+        print(f"{thread_name}: Rendered page {page_num} at {dpi} DPI")
+        
+        # First do OCR processing
+        page_num, error, ocr_result = process_page(image, page_num, pdf_path, record_id, before_request)
+        
+        # Then do Cloudinary upload from a smaller web derivative
+        cloudinary_result = None
+        if not error:
+            web_image = web_derivative(image, dpi)
+            try:
+                cloudinary_result = upload_page_image(
+                    web_image, 
+                    f"{Path(pdf_path).stem}_page_{page_num}"
+                )
+            finally:
+                if web_image is not image:
+                    web_image.close()
+    # The bitmap is closed and its budget released at this point
     
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content([prompt, image])
-            
-            # Check if we got a valid response
-            if not response.text:
-                error_msg = "Copyright detection or empty response"
-                return page_num, error_msg, None
-            
-            return page_num, None, response.text
-            
-        except Exception as e:
-            if attempt == max_retries - 1:
-                return page_num, str(e), None
-            time.sleep(retry_delay * (attempt + 1))
+    # Everything for the page row, written in one insert
+    page_data = {
+        'parent_record_id': record_id,
+        'page_number': page_num,
+    }
+    
+    if error:
+        page_data.update({
+            'ocr_result': f"ERROR: {error}",
+            'error': True
+        })
+    else:
+        page_data.update({
+            'ocr_result': ocr_result,
+            'error': False
+        })
+        
+    if cloudinary_result:
+        page_data['cloudinary'] = cloudinary_result
+    return page_data, error
+
+def save_page(page_data: dict):
+    with timed('db_write', page=page_data['page_number']):
+        supabase.table('page').insert(page_data).execute()
 
 def process_pdf(pdf_path: str):
     """Process a PDF file page by page and store results in Supabase"""
     print(f"Processing {pdf_path}")
     
     try:
-        # Get record ID based on PDF filename
-        record_id = get_record_id(pdf_path)
+        record_id, record_number, pdf_page_count = queue_pdf(pdf_path)
         print(f"Found record ID: {record_id}")
         
-        # Check total pages
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            pdf_page_count = len(pdf_reader.pages)
-        
-        processed_pages = get_processed_pages(record_id)
+        processed_pages = ledger.pages(record_number, OCR, (DONE, ERROR))
         if len(processed_pages) == pdf_page_count:
             print(f"✓ {pdf_path}: All {pdf_page_count} pages already processed")
             return
         
         print(f"Total pages in PDF: {pdf_page_count}")
-        print(f"Pages already in database: {len(processed_pages)}")
+        print(f"Pages already processed: {len(processed_pages)}")
+        
+        owner = default_owner()
         
         def process_single_page(page_num):
             thread_name = threading.current_thread().name
             
-            # Check if page already exists and has OCR + cloudinary data
-            result = supabase.table('page').select('*').eq('parent_record_id', record_id).eq('page_number', page_num).execute()
-            if result.data and len(result.data) > 0:
-                page = result.data[0]
-                if page.get('cloudinary') and page.get('ocr_result'):
-                    print(f"{thread_name}: Page {page_num} already processed, skipping")
-                    return
             print(f"{thread_name}: Converting page {page_num}/{pdf_page_count}")
             
             try:
-                # Convert single page with lower DPI and memory optimization
-                images = convert_from_path(
-                    pdf_path,
-                    dpi=300,  
-                    first_page=page_num,
-                    last_page=page_num,
-                    thread_count=1,  
-                )
-                
-                if not images:
-                    print(f"{thread_name}: Failed to convert page {page_num}")
+                page_data, error = ocr_page(pdf_path, page_num, record_id)
+                if page_data is None:
+                    # Nothing to write, but don't leave the job leased
+                    ledger.fail(record_number, OCR, error, page_num)
                     return
-                
-                # First do OCR processing
-                page_num, error, ocr_result = process_page(images[0], page_num, pdf_path, record_id)
-                
-                # Then do Cloudinary upload
-                cloudinary_result = None
-                if not error:
-                    cloudinary_result = upload_page_image(
-                        images[0], 
-                        f"{Path(pdf_path).stem}_page_{page_num}"
-                    )
-                
-                # Insert all results in one go
-                page_data = {
-                    'parent_record_id': record_id,
-                    'page_number': page_num,
-                }
+                save_page(page_data)
                 
                 if error:
-                    page_data.update({
-                        'ocr_result': f"ERROR: {error}",
-                        'error': True
-                    })
+                    ledger.fail(record_number, OCR, error, page_num)
                 else:
-                    page_data.update({
-                        'ocr_result': ocr_result,
-                        'error': False
-                    })
-                    
-                if cloudinary_result:
-                    page_data['cloudinary'] = cloudinary_result
-                    
-                supabase.table('page').insert(page_data).execute()
+                    ledger.done(record_number, OCR, page_num)
+                if page_data.get('cloudinary'):
+                    ledger.done(record_number, UPLOAD, page_num)
                 
                 if error:
                     print(f"{thread_name}: Error processing page {page_num}: {error}")
                 else:
                     print(f"{thread_name}: Successfully processed page {page_num}")
                 
-                # Clear the image from memory immediately
-                images[0].close()
-                del images
-                
-                # Force garbage collection
-                import gc
-                gc.collect()
-                
             except Exception as e:
                 print(f"{thread_name}: Error processing page {page_num}: {str(e)}")
-                # Force garbage collection on error too
-                gc.collect()
+                ledger.fail(record_number, OCR, str(e), page_num)
         
-        # Get pages that need processing
-        pages_to_process = [
-            page_num for page_num in range(1, pdf_page_count + 1)
-            if page_num not in processed_pages
-        ]
+        def work():
+            # Lease one page at a time so other processes can share this record
+            while True:
+                leased = ledger.lease(OCR, owner, record_number=record_number)
+                if not leased:
+                    return
+                metrics.queue_depth('ocr', ledger.count(OCR))
+                process_single_page(leased[0][1])
         
         # Process pages with thread pool - increased max_workers since we're not doing concurrent operations per page
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            executor.map(process_single_page, pages_to_process)
+        with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+            for _ in range(OCR_WORKERS):
+                executor.submit(work)
             
         print(f"Completed processing {pdf_path}")
         
@@ -239,26 +193,21 @@ def process_directory(directory: str = "downloaded-pdfs"):
     for pdf_file in sorted(pdf_dir.glob("*.pdf")):
         try:
             process_pdf(str(pdf_file))
-            # Force garbage collection between PDFs
-            import gc
-            gc.collect()
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
-
-if __name__ == "__main__":
-    # Suppress MallocStackLogging warnings
-    import sys
-    import os
     
-    # Redirect stderr to devnull for specific warnings
-    stderr = sys.stderr
-    devnull = open(os.devnull, 'w')
-    sys.stderr = devnull
+    print(f"Peak bitmap memory: {budget.peak / 1_000_000:.1f} MB, peak RSS: {peak_rss_mb():.1f} MB")
+
+def main(directory: str = "downloaded-pdfs"):
+    # The MallocStackLogging warnings on macOS come from pdftoppm inheriting
+    # these variables, so drop them rather than hiding all of stderr
+    os.environ.pop('MallocStackLogging', None)
+    os.environ.pop('MallocStackLoggingNoCompact', None)
     
     # Make sure required environment variables are set:
     # GOOGLE_API_KEY, SUPABASE_URL, SUPABASE_KEY
-    process_directory()
-    
-    # Restore stderr
-    sys.stderr = stderr
-    devnull.close()
\ No newline at end of file
+    metrics.start()
+    process_directory(directory)
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,35 @@
+import argparse
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from pdf2image import convert_from_path
-import cloudinary
-import cloudinary.uploader
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
 from datetime import datetime
+from clients import supabase, ledger
+from render import rendered_page, render_pages_to_files, web_derivative, bitmap_bytes, budget, UPLOAD_DPI, MAX_OCR_DPI
+from ledger import OCR, UPLOAD, REOCR, default_owner
+from ocr import process_page, OCR_WORKERS
+from upload import upload_page_image
+from metrics import metrics, timed
+import db
 
-# Load environment variables
-load_dotenv()
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
-
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
-
-def upload_page_image(image: Image, filename: str) -> dict:
-    """Upload image to Cloudinary"""
-    print(f"Uploading {filename} to Cloudinary...")
-    
-    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-        try:
-            # Convert to RGB and save as JPEG with compression
-            rgb_image = image.convert('RGB')
-            rgb_image.save(tmp_file.name, 'JPEG', quality=85, optimize=True)
-            
-            # Check file size and reduce quality if needed
-            quality = 85
-            while os.path.getsize(tmp_file.name) > 10_000_000:  # 10MB limit
-                quality = int(quality * 0.9)  # Reduce quality by 10%
-                if quality < 20:  # Set minimum quality threshold
-                    print(f"Could not reduce file size enough")
-                    return None
-                rgb_image.save(tmp_file.name, 'JPEG', quality=quality, optimize=True)
-            
-            # Upload the temporary file to Cloudinary
-            result = cloudinary.uploader.upload(tmp_file.name, public_id=filename)
-            print(f"Cloudinary upload result: {result}")
-            
-            return result
-        finally:
-            rgb_image.close()
-            if os.path.exists(tmp_file.name):
-                os.unlink(tmp_file.name)
+BATCH_SIZE = 200
+PAGE_COLUMNS = ['id', 'page_number', 'parent_record_id', 'record:record(pdf_link)']
+
+def fetch_error_pages() -> list:
+    """All pages flagged with an error"""
+    return db.fetch_all('page', PAGE_COLUMNS, error=True)
 
 def process_error_pages():
     """Process pages with errors"""
     # Get all pages with errors
-    result = supabase.table('page').select(
-        'id',
-        'page_number',
-        'parent_record_id',
-        'record:record(pdf_link)'
-    ).eq('error', True).execute()
-
-    if not result.data:
+    pages = fetch_error_pages()
+
+    if not pages:
         print("No error pages found")
         return
 
-    for page in result.data:
+    for page in pages:
         try:
             # Extract filename from pdf_link
             pdf_link = page['record']['pdf_link']
@@ -81,44 +42,223 @@ def process_error_pages():
 
             print(f"Processing page {page['page_number']} from {filename}")
 
-            # Convert single page
-            images = convert_from_path(
-                pdf_path,
-                dpi=300,
-                first_page=page['page_number'],
-                last_page=page['page_number'],
-                thread_count=1
-            )
-
-            if not images:
-                print(f"Failed to convert page {page['page_number']}")
-                continue
+            # Render straight at the web resolution, no OCR happens here
+            with rendered_page(pdf_path, page['page_number'], dpi=UPLOAD_DPI) as (image, _):
+                if image is None:
+                    print(f"Failed to convert page {page['page_number']}")
+                    continue
 
-            # Upload to Cloudinary
-            cloudinary_result = upload_page_image(
-                images[0],
-                f"{Path(pdf_path).stem}_page_{page['page_number']}"
-            )
+                # Upload to Cloudinary
+                cloudinary_result = upload_page_image(
+                    image,
+                    f"{Path(pdf_path).stem}_page_{page['page_number']}"
+                )
 
             if cloudinary_result:
                 # Update page record with cloudinary data and updated_at timestamp
-                supabase.table('page').update({
-                    'cloudinary': cloudinary_result,
-                    'updated_at': datetime.utcnow().isoformat()
-                }).eq('id', page['id']).execute()
+                with timed('db_write', page=page['page_number']):
+                    supabase.table('page').update({
+                        'cloudinary': cloudinary_result,
+                        'updated_at': datetime.utcnow().isoformat()
+                    }).eq('id', page['id']).execute()
+                ledger.done(Path(pdf_path).stem, UPLOAD, page['page_number'])
                 print(f"Successfully uploaded page {page['page_number']}")
 
-            # Cleanup
-            images[0].close()
-            del images
-
         except Exception as e:
             print(f"Error processing page {page['page_number']}: {str(e)}")
 
-        # Force garbage collection
-        import gc
-        gc.collect()
+def fetch_queued_pages(limit: int) -> list:
+    """Lease the worst-scoring pages from the re-OCR queue (see score-ocr.py)"""
+    leased = ledger.lease(REOCR, default_owner(), limit=limit, seconds=3600)
+    by_record = {}
+    for record_number, page_num in leased:
+        by_record.setdefault(record_number, []).append(page_num)
+
+    pages = []
+    for record_number, page_numbers in by_record.items():
+        record = ledger.get_record(record_number)
+        if not record or not record['record_id']:
+            print(f"Skipping {record_number}: not in the ledger's record table")
+            continue
+        pages.extend(db.select_in('page', PAGE_COLUMNS, 'page_number', page_numbers,
+                                  parent_record_id=record['record_id']))
+    return pages
+
+def recover_page(page: dict, image_path: str, pdf_stem: str, stage: str = OCR) -> dict:
+    """Re-run OCR and the Cloudinary upload for one errored or badly OCR'd page"""
+    page_num = page['page_number']
+    # Opening only reads the header, so the size is known before any pixels load
+    image = Image.open(image_path)
+    try:
+        needed = bitmap_bytes(image) * 2
+        with budget.reserve(needed):
+            image.load()
+            _, error, ocr_result = process_page(image, page_num, None, page['parent_record_id'])
+            if error:
+                print(f"Page {page_num} of {pdf_stem} still failing: {error}")
+                ledger.fail(pdf_stem, stage, error, page_num)
+                return None
+
+            web_image = web_derivative(image, MAX_OCR_DPI)
+            try:
+                cloudinary_result = upload_page_image(web_image, f"{pdf_stem}_page_{page_num}")
+            finally:
+                if web_image is not image:
+                    web_image.close()
+    finally:
+        image.close()
+
+    ledger.done(pdf_stem, stage, page_num)
+    row = {
+        'id': page['id'],
+        'parent_record_id': page['parent_record_id'],
+        'page_number': page_num,
+        'ocr_result': ocr_result,
+        'error': False,
+        'updated_at': datetime.utcnow().isoformat(),
+    }
+    if cloudinary_result:
+        row['cloudinary'] = cloudinary_result
+        ledger.done(pdf_stem, UPLOAD, page_num)
+    print(f"Recovered page {page_num} of {pdf_stem}")
+    return row
+
+def write_rows(rows: list):
+    """Upsert recovered pages in batches"""
+    db.upsert('page', rows, batch_size=BATCH_SIZE)
+    print(f"Wrote {len(rows)} recovered pages")
+
+def requeue_records(record_numbers: dict):
+    """Send records whose pages were recovered back through build-corpus and upload
+
+    record_numbers maps record IDs to record numbers.
+    """
+    record_ids = list(record_numbers)
+    for start in range(0, len(record_ids), db.IN_BATCH_SIZE):
+        chunk = record_ids[start:start + db.IN_BATCH_SIZE]
+        with timed('db_write', table='record', rows=len(chunk)):
+            supabase.table('record').update({'in_anything_llm': False}).in_('id', chunk).execute()
+    ledger.requeue_corpus(record_numbers.values())
+    print(f"Queued {len(record_numbers)} records to rebuild their corpus files and re-ingest")
+
+def recover_error_pages():
+    """Re-OCR and re-upload errored pages"""
+    pages = fetch_error_pages()
+    if not pages:
+        print("No error pages found")
+        return
+    changed = recover_pages(pages, OCR)
+    if changed:
+        requeue_records(changed)
+
+def reocr_queued_pages(limit: int = 1000):
+    """Re-OCR and re-upload the worst pages in the re-OCR queue"""
+    pages = fetch_queued_pages(limit)
+    if not pages:
+        print("No pages queued for re-OCR")
+        return
+    changed = recover_pages(pages, REOCR)
+    if changed:
+        requeue_records(changed)
+
+def recover_pages(pages: list, stage: str) -> dict:
+    """Re-OCR and re-upload pages in parallel, rendering each PDF once
+
+    Returns {record ID: record number} for the records with recovered pages.
+    """
+    by_pdf = {}
+    record_numbers = {}
+    for page in pages:
+        # One bad row (no page number, an orphaned or link-less record) only costs that page
+        try:
+            page['page_number'] = int(page['page_number'])
+            filename = page['record']['pdf_link'].split('/')[-1]
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            print(f"Skipping page {page.get('id')}: no page number or PDF link ({type(e).__name__}: {str(e)})")
+            continue
+        by_pdf.setdefault(filename, []).append(page)
+        record_numbers[page['parent_record_id']] = Path(filename).stem
+    queued = sum(len(pdf_pages) for pdf_pages in by_pdf.values())
+    print(f"Recovering {queued} pages from {len(by_pdf)} PDFs")
+
+    rows = []
+    recovered = 0
+    # Records with at least one recovered page, whose corpus files are now stale
+    changed = set()
+
+    def finish(batch):
+        # Wait for one PDF's pages, then drop its rendered images
+        tmp_dir, futures = batch
+        for future in futures:
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"Error recovering page: {str(e)}")
+                continue
+            if row:
+                rows.append(row)
+        tmp_dir.cleanup()
+
+    with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+        previous = None
+        for filename, pdf_pages in by_pdf.items():
+            pdf_path = f"downloaded-pdfs/{filename}"
+            if not os.path.exists(pdf_path):
+                print(f"PDF file not found: {pdf_path}")
+                continue
+
+            # Errored pages are the hard ones, so they get the full OCR resolution
+            tmp_dir = tempfile.TemporaryDirectory()
+            try:
+                paths = render_pages_to_files(
+                    pdf_path, [page['page_number'] for page in pdf_pages], MAX_OCR_DPI, tmp_dir.name
+                )
+            except Exception as e:
+                print(f"Error rendering {filename}: {str(e)}")
+                tmp_dir.cleanup()
+                continue
+
+            metrics.queue_depth('ocr', queued - recovered - len(rows))
+            futures = [
+                executor.submit(recover_page, page, paths[page['page_number']], Path(pdf_path).stem, stage)
+                for page in pdf_pages
+                if page['page_number'] in paths
+            ]
+
+            # The next PDF renders while this one's pages are still being OCR'd
+            if previous:
+                finish(previous)
+            previous = (tmp_dir, futures)
+
+            if len(rows) >= BATCH_SIZE:
+                recovered += len(rows)
+                write_rows(rows)
+                changed.update(row['parent_record_id'] for row in rows)
+                rows.clear()
+
+        if previous:
+            finish(previous)
+
+    if rows:
+        recovered += len(rows)
+        write_rows(rows)
+        changed.update(row['parent_record_id'] for row in rows)
+    print(f"Recovered {recovered} of {len(pages)} pages")
+    print(f"Peak bitmap memory: {budget.peak / 1_000_000:.1f} MB")
+    return {record_id: record_numbers[record_id] for record_id in changed}
 
 if __name__ == "__main__":
-    process_error_pages()
+    parser = argparse.ArgumentParser(description="Fix up pages that errored during OCR")
+    parser.add_argument('--recover', action='store_true',
+                        help="re-run OCR as well as the upload, in parallel")
+    parser.add_argument('--reocr', type=int, metavar='N',
+                        help="re-OCR the N worst pages queued by score-ocr.py")
+    args = parser.parse_args()
 
+    metrics.start()
+    if args.reocr:
+        reocr_queued_pages(args.reocr)
+    elif args.recover:
+        recover_error_pages()
+    else:
+        process_error_pages()
@@ -0,0 +1,494 @@
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import db
+
+# Local job ledger shared by every script in processing/.
+#
+# Each (record, page, stage) has exactly one row with its current state, so
+# "what is left to do" is an indexed local query instead of a scan of the
+# remote tables. Workers take work with lease(), which atomically moves rows
+# from pending to leased for a fixed time; a crashed worker's leases simply
+# expire and the rows become available again. Several processes on one machine
+# can share a ledger file. Machines can't: the file runs in WAL mode, whose
+# shared-memory index doesn't work over a network filesystem, so OCR workers on
+# other hosts go through the Redis broker instead (see broker.py).
+
+LEDGER_PATH = os.getenv('LEDGER_PATH', 'ledger.sqlite3')
+
+# Stages, in pipeline order. Record-level stages use page RECORD.
+DOWNLOAD = 'download'
+OCR = 'ocr'
+UPLOAD = 'upload'
+CORPUS = 'corpus'
+INGEST = 'ingest'
+# Pages whose OCR text scored badly (see score-ocr.py), highest priority first
+REOCR = 'reocr'
+STAGES = [DOWNLOAD, OCR, UPLOAD, CORPUS, INGEST, REOCR]
+
+RECORD = 0
+
+# States
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+ERROR = 'error'
+
+DEFAULT_LEASE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    record_number TEXT PRIMARY KEY,
+    record_id TEXT,
+    pdf_link TEXT,
+    num_pages INTEGER,
+    document TEXT
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    record_number TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    priority REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (record_number, page, stage)
+);
+
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (stage, state, record_number, page);
+
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT NOT NULL,
+    started INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (name, started)
+);
+"""
+
+
+def default_owner() -> str:
+    """Lease owner name for this process, unique across machines"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Ledger:
+    """SQLite-backed per-(record, page, stage) job state"""
+
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        columns = {row[1] for row in self._conn().execute('PRAGMA table_info(jobs)')}
+        if 'priority' not in columns:
+            # Ledgers created before jobs had a priority
+            self._conn().execute('ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0')
+        if 'document' not in {row[1] for row in self._conn().execute('PRAGMA table_info(records)')}:
+            # Ledgers created before uploads were remembered
+            self._conn().execute('ALTER TABLE records ADD COLUMN document TEXT')
+        # After the migration, since older ledgers have no priority column until then
+        self._conn().execute(
+            'CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (stage, state, priority DESC, record_number, page)'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, so keep one each
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block under a write lock; BEGIN IMMEDIATE makes leasing atomic"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # Records
+
+    def add_record(self, record_number: str, record_id: str = None,
+                   pdf_link: str = None, num_pages: int = None):
+        """Insert or update what we know about a record"""
+        self.add_records([(record_number, record_id, pdf_link, num_pages)])
+
+    def add_records(self, records: Iterable[Tuple[str, str, str, int]]):
+        """Bulk version of add_record for (record_number, record_id, pdf_link, num_pages)"""
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO records (record_number, record_id, pdf_link, num_pages)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (record_number) DO UPDATE SET
+                    record_id = COALESCE(excluded.record_id, record_id),
+                    pdf_link = COALESCE(excluded.pdf_link, pdf_link),
+                    num_pages = COALESCE(excluded.num_pages, num_pages)
+                """,
+                list(records)
+            )
+
+    def get_record(self, record_number: str) -> Optional[dict]:
+        row = self._conn().execute(
+            'SELECT record_number, record_id, pdf_link, num_pages, document FROM records WHERE record_number = ?',
+            (record_number,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('record_number', 'record_id', 'pdf_link', 'num_pages', 'document'), row))
+
+    def set_document(self, record_number: str, document: Optional[str]):
+        """Remember where a record's corpus file lives in AnythingLLM, so re-ingesting can replace it"""
+        with self.transaction() as conn:
+            conn.execute('UPDATE records SET document = ? WHERE record_number = ?', (document, record_number))
+
+    # Jobs
+
+    def add(self, record_number: str, stage: str, pages: Iterable[int] = (RECORD,)):
+        """Register jobs as pending; jobs that already exist are left alone"""
+        self.add_jobs(stage, [(record_number, page) for page in pages])
+
+    def add_jobs(self, stage: str, jobs: Iterable[Tuple[str, int]]):
+        """Bulk version of add for many (record_number, page) jobs"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO jobs (record_number, page, stage, state, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(record_number, page, stage, PENDING, now) for record_number, page in jobs]
+            )
+
+    def set_state(self, record_number: str, stage: str, state: str,
+                  page: int = RECORD, error: str = None):
+        """Record the outcome of a job, creating it if needed"""
+        self.set_states(stage, state, [(record_number, page)], error=error)
+
+    def set_states(self, stage: str, state: str, jobs: Iterable[Tuple[str, int]],
+                   error: str = None):
+        """Bulk version of set_state for many (record_number, page) jobs"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO jobs (record_number, page, stage, state, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (record_number, page, stage) DO UPDATE SET
+                    state = excluded.state,
+                    error = excluded.error,
+                    lease_owner = NULL,
+                    lease_expires = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                [(record_number, page, stage, state, error, now) for record_number, page in jobs]
+            )
+
+    def enqueue(self, stage: str, jobs: Iterable[Tuple[str, int, float]]):
+        """Put (record_number, page, priority) jobs in the pending state, done or not
+
+        lease() hands out higher priorities first, so this is how a ranked
+        queue is fed into the ledger.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO jobs (record_number, page, stage, state, priority, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (record_number, page, stage) DO UPDATE SET
+                    state = excluded.state,
+                    priority = excluded.priority,
+                    error = NULL,
+                    lease_owner = NULL,
+                    lease_expires = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                [(record_number, page, stage, PENDING, priority, now) for record_number, page, priority in jobs]
+            )
+
+    def queue_pipeline(self, record_number: str, num_pages: int):
+        """Mark a record downloaded and queue every later stage for it"""
+        self.done(record_number, DOWNLOAD)
+        self.add(record_number, OCR, range(1, num_pages + 1))
+        self.add(record_number, UPLOAD, range(1, num_pages + 1))
+        self.add(record_number, CORPUS)
+        self.add(record_number, INGEST)
+
+    def requeue_corpus(self, record_numbers: Iterable[str]):
+        """Rebuild and re-ingest records whose page text changed
+
+        Their ocr-text files are deleted, since make-pages.py skips records
+        that already have one, and their corpus and ingest jobs go back to pending.
+        """
+        jobs = [(record_number, RECORD) for record_number in sorted(set(record_numbers))]
+        for record_number, _ in jobs:
+            corpus_file = Path('ocr-text', f"{record_number}.txt")
+            if corpus_file.exists():
+                corpus_file.unlink()
+        self.set_states(CORPUS, PENDING, jobs)
+        self.set_states(INGEST, PENDING, jobs)
+
+    def forget(self, record_number: str):
+        """Drop every job for a record, e.g. when a new release replaces its PDF"""
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM jobs WHERE record_number = ?', (record_number,))
+
+    def done(self, record_number: str, stage: str, page: int = RECORD):
+        self.set_state(record_number, stage, DONE, page)
+
+    def fail(self, record_number: str, stage: str, error: str, page: int = RECORD):
+        self.set_state(record_number, stage, ERROR, page, error=error)
+
+    def reset(self, record_number: str, stage: str, page: int = RECORD):
+        """Put a job back to pending so it gets picked up again"""
+        self.set_state(record_number, stage, PENDING, page)
+
+    def lease(self, stage: str, owner: str = None, limit: int = 1,
+              seconds: float = DEFAULT_LEASE_SECONDS,
+              record_number: str = None, max_attempts: int = None) -> List[Tuple[str, int]]:
+        """Atomically claim up to `limit` pending (or expired) jobs for a stage
+
+        With max_attempts, expired jobs that have already been leased that many
+        times are marked as errors instead, so a page that keeps killing its
+        worker isn't handed out forever.
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        # Expired leases and pending jobs are looked up separately so that each
+        # query walks an index instead of sorting the whole stage: the pending
+        # queue in jobs_by_priority order, one record's pages (a small sort)
+        # and the few leased rows through jobs_by_state
+        source, extra, params = 'jobs', '', []
+        if record_number is not None:
+            source, extra, params = 'jobs INDEXED BY jobs_by_state', ' AND record_number = ?', [record_number]
+
+        with self.transaction() as conn:
+            if max_attempts:
+                conn.execute(
+                    f"""
+                    UPDATE jobs SET state = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                    WHERE stage = ? AND state = ? AND lease_expires < ? AND attempts >= ?{extra}
+                    """,
+                    [ERROR, 'Lease expired too many times', now, stage, LEASED, now, max_attempts, *params]
+                )
+            jobs = conn.execute(
+                f"""
+                SELECT record_number, page FROM jobs
+                WHERE stage = ? AND state = ? AND lease_expires < ?{extra}
+                ORDER BY record_number, page LIMIT ?
+                """,
+                [stage, LEASED, now, *params, limit]
+            ).fetchall()
+            if len(jobs) < limit:
+                jobs += conn.execute(
+                    f"""
+                    SELECT record_number, page FROM {source}
+                    WHERE stage = ? AND state = ?{extra}
+                    ORDER BY priority DESC, record_number, page LIMIT ?
+                    """,
+                    [stage, PENDING, *params, limit - len(jobs)]
+                ).fetchall()
+            conn.executemany(
+                """
+                UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE record_number = ? AND page = ? AND stage = ?
+                """,
+                [(LEASED, owner, now + seconds, now, rec, page, stage) for rec, page in jobs]
+            )
+        return [(rec, page) for rec, page in jobs]
+
+    def extend(self, record_number: str, stage: str, page: int, owner: str,
+               seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Push back the expiry of a lease `owner` still holds; False if it has lost it"""
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET lease_expires = ?, updated_at = ?
+                WHERE record_number = ? AND page = ? AND stage = ? AND state = ? AND lease_owner = ?
+                """,
+                (now + seconds, now, record_number, page, stage, LEASED, owner)
+            )
+        return cursor.rowcount > 0
+
+    def attempts(self, record_number: str, stage: str, page: int = RECORD) -> int:
+        """How many times a job has been leased"""
+        row = self._conn().execute(
+            'SELECT attempts FROM jobs WHERE record_number = ? AND page = ? AND stage = ?',
+            (record_number, page, stage)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def take(self, name: str, limit: int, window: float = 60) -> float:
+        """Use one slot of a rate limit shared by every process on this ledger
+
+        Returns 0 if there was a slot left in the current window, otherwise
+        the seconds until the next window starts (nothing is used then).
+        """
+        now = time.time()
+        started = int(now // window)
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM rate_limits WHERE name = ? AND started < ?', (name, started))
+            row = conn.execute(
+                'SELECT count FROM rate_limits WHERE name = ? AND started = ?', (name, started)
+            ).fetchone()
+            if row and row[0] >= limit:
+                return (started + 1) * window - now
+            conn.execute(
+                """
+                INSERT INTO rate_limits (name, started, count) VALUES (?, ?, 1)
+                ON CONFLICT (name, started) DO UPDATE SET count = count + 1
+                """,
+                (name, started)
+            )
+        return 0
+
+    def pages(self, record_number: str, stage: str, states: Iterable[str] = (DONE,)) -> Set[int]:
+        """Pages of a record whose job for `stage` is in one of `states`"""
+        states = list(states)
+        rows = self._conn().execute(
+            f"""
+            SELECT page FROM jobs
+            WHERE record_number = ? AND stage = ? AND state IN ({','.join('?' * len(states))})
+            """,
+            [record_number, stage, *states]
+        ).fetchall()
+        return {page for (page,) in rows}
+
+    def has_jobs(self, record_number: str, stage: str) -> bool:
+        row = self._conn().execute(
+            'SELECT 1 FROM jobs WHERE record_number = ? AND stage = ? LIMIT 1',
+            (record_number, stage)
+        ).fetchone()
+        return row is not None
+
+    def state(self, record_number: str, stage: str, page: int = RECORD) -> Optional[str]:
+        row = self._conn().execute(
+            'SELECT state FROM jobs WHERE record_number = ? AND page = ? AND stage = ?',
+            (record_number, page, stage)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find(self, stage: str, states: Iterable[str] = (PENDING,)) -> List[Tuple[str, int]]:
+        """All (record_number, page) jobs of a stage in one of `states`"""
+        states = list(states)
+        return self._conn().execute(
+            f"""
+            SELECT record_number, page FROM jobs
+            WHERE stage = ? AND state IN ({','.join('?' * len(states))})
+            ORDER BY record_number, page
+            """,
+            [stage, *states]
+        ).fetchall()
+
+    def count(self, stage: str, states: Iterable[str] = (PENDING,)) -> int:
+        """Number of jobs of a stage in one of `states`"""
+        states = list(states)
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE stage = ? AND state IN ({','.join('?' * len(states))})",
+            [stage, *states]
+        ).fetchone()[0]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """{stage: {state: count}} across the whole ledger"""
+        counts = {}
+        rows = self._conn().execute('SELECT stage, state, COUNT(*) FROM jobs GROUP BY stage, state')
+        for stage, state, count in rows:
+            counts.setdefault(stage, {})[state] = count
+        return counts
+
+
+def sync_from_supabase(ledger: Ledger, supabase, page_size: int = 1000):
+    """Seed the ledger from the remote tables and the local output folders"""
+    records = db.fetch_all('record', ['id', 'record_number', 'pdf_link', 'num_pages', 'in_anything_llm'],
+                           client=supabase, page_size=page_size)
+    print(f"Fetched {len(records)} records")
+
+    by_id = {}
+    known = []
+    done = {stage: [] for stage in STAGES}
+    pending = {stage: [] for stage in STAGES}
+    failed = []
+
+    for record in records:
+        filename = record['pdf_link'].split('/')[-1] if record.get('pdf_link') else None
+        record_number = record.get('record_number') or (filename or '').replace('.pdf', '')
+        if not record_number:
+            continue
+        by_id[record['id']] = record_number
+        known.append((record_number, record['id'], record.get('pdf_link'), record.get('num_pages')))
+
+        done[DOWNLOAD].append((record_number, RECORD))
+        for page in range(1, (record.get('num_pages') or 0) + 1):
+            pending[OCR].append((record_number, page))
+            pending[UPLOAD].append((record_number, page))
+        if record.get('in_anything_llm'):
+            done[INGEST].append((record_number, RECORD))
+        else:
+            pending[INGEST].append((record_number, RECORD))
+        if Path('ocr-text', f"{record_number}.txt").exists():
+            done[CORPUS].append((record_number, RECORD))
+        else:
+            pending[CORPUS].append((record_number, RECORD))
+
+    pages = 0
+    for page in db.paged('page', ['id', 'parent_record_id', 'page_number', 'error',
+                                  'uploaded:cloudinary->>public_id'],
+                         client=supabase, page_size=page_size):
+        pages += 1
+        record_number = by_id.get(page['parent_record_id'])
+        if record_number is None or page.get('page_number') is None:
+            continue
+        job = (record_number, int(page['page_number']))
+        if page.get('error'):
+            failed.append(job)
+        else:
+            done[OCR].append(job)
+        if page.get('uploaded'):
+            done[UPLOAD].append(job)
+
+    print(f"Fetched {pages} pages")
+
+    ledger.add_records(known)
+    for stage in STAGES:
+        ledger.add_jobs(stage, pending[stage])
+        ledger.set_states(stage, DONE, done[stage])
+    ledger.set_states(OCR, ERROR, failed, error='OCR error in database')
+
+    print(f"Synced ledger at {ledger.path}")
+
+
+def print_status(ledger: Ledger):
+    counts = ledger.counts()
+    for stage in STAGES:
+        states = counts.get(stage, {})
+        summary = ', '.join(f"{state}: {states.get(state, 0)}" for state in (PENDING, LEASED, DONE, ERROR))
+        print(f"{stage:>8}  {summary}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    ledger = Ledger()
+
+    if command == 'sync':
+        from clients import supabase
+        sync_from_supabase(ledger, supabase.get())
+    print_status(ledger)
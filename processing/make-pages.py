@@ -1,49 +1,34 @@
-import os
 from pathlib import Path
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from clients import supabase, ledger
+from metrics import metrics, timed
+import db
+from ledger import CORPUS, INGEST, OCR, DONE, ERROR, PENDING
+from normalize import Stats, normalize_stream
 
-# Load environment variables and initialize Supabase client
-load_dotenv()
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
-
-def save_concatenated_pages():
+def concatenated_records(output_dir: Path):
     """
-    Fetch all records and their pages from Supabase,
-    concatenate page contents in order, and save to files
+    Fetch records still missing a corpus file and their pages from Supabase,
+    yielding (record_number, concatenated page text) in ledger order
     """
-    # Create output directory if it doesn't exist
-    output_dir = Path("ocr-text")
-    output_dir.mkdir(exist_ok=True)
-    
-    # Get all records
-    records = supabase.table('record')\
-        .select('*')\
-        .is_('in_anything_llm', 'null')\
-        .execute()
-        
-    for record in records.data:
-        record_id = record['id']
-        record_number = record['record_number']
-        # Strip .pdf from filename for output
-        output_filename = record_number.replace('.pdf', '') if record_number else str(record_id)
-        output_path = output_dir / f"{output_filename}.txt"
+    # Records still waiting for a corpus file, straight from the local ledger
+    for record_number, _ in ledger.find(CORPUS, (PENDING,)):
+        if ledger.state(record_number, INGEST) == DONE:
+            continue
+        record = ledger.get_record(record_number)
+        if not record or not record['record_id']:
+            print(f"Skipping {record_number}: not in the ledger's record table")
+            continue
+        record_id = record['record_id']
+        output_path = output_dir / f"{record_number}.txt"
         
         # Skip if output file already exists
         if output_path.exists():
             print(f"✓ {record_number}: Output file already exists")
+            ledger.done(record_number, CORPUS)
             continue
             
-        # Get count of all pages in database for this record
-        pages = supabase.table('page')\
-            .select('*')\
-            .eq('parent_record_id', record_id)\
-            .execute()
-            
-        db_page_count = len(pages.data)
+        # Count of all pages processed for this record, errors included
+        db_page_count = len(ledger.pages(record_number, OCR, (DONE, ERROR)))
         
         # Update record record if num_pages is None
         if record['num_pages'] is None:
@@ -51,6 +36,7 @@ def save_concatenated_pages():
                 .update({'num_pages': db_page_count})\
                 .eq('id', record_id)\
                 .execute()
+            ledger.add_record(record_number, num_pages=db_page_count)
             print(f"Updated {record_number} with correct page count: {db_page_count}")
         # Skip only if page counts don't match and num_pages is not None
         elif db_page_count != record['num_pages']:
@@ -58,29 +44,44 @@ def save_concatenated_pages():
             continue
             
         # Get all non-error pages for this record, ordered by page number
-        valid_pages = supabase.table('page')\
-            .select('*')\
-            .eq('parent_record_id', record_id)\
-            .eq('error', False)\
-            .order('page_number')\
-            .execute()
+        valid_pages = db.fetch_all('page', ['page_number', 'ocr_result'], order='page_number',
+                                   parent_record_id=record_id, error=False)
             
-        if not valid_pages.data:
+        if not valid_pages:
             print(f"No valid pages found for record {record_number}")
             continue
             
-        # Concatenate page contents in order
-        full_text = ""
-        for page in valid_pages.data:
-            # Remove ```text annotations if present
-            cleaned_text = page['ocr_result'].replace('```text', '') if page['ocr_result'] else ''
-            full_text += cleaned_text + "\n"
-            
+        # Concatenate page contents in order; fences, banners and the like
+        # are cleaned up by the normalizer
+        yield record_number, "\n".join(page['ocr_result'] or '' for page in valid_pages)
+
+def save_concatenated_pages():
+    """
+    Concatenate every pending record's pages, normalize the text across a
+    process pool and save one file per record
+    """
+    # Create output directory if it doesn't exist
+    output_dir = Path("ocr-text")
+    output_dir.mkdir(exist_ok=True)
+    
+    stats = Stats()
+    for record_number, full_text in normalize_stream(concatenated_records(output_dir), stats):
+        output_path = output_dir / f"{record_number}.txt"
+        
         # Save to file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_text)
+        with timed('corpus', record=record_number) as span:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(full_text)
+            span['bytes'] = output_path.stat().st_size
             
+        ledger.done(record_number, CORPUS)
         print(f"Saved concatenated text for {record_number}")
+    
+    if stats.items:
+        metrics.inc('bytes_saved', 'normalize', stats.bytes_in - stats.bytes_out)
+        metrics.inc('tokens_saved', 'normalize', stats.tokens_in - stats.tokens_out)
+        print(stats.summary())
 
 if __name__ == "__main__":
+    metrics.start()
     save_concatenated_pages()
@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight instrumentation shared by every stage in processing/.
+#
+# Stages call timed('ocr') around a unit of work and add byte counts or queue
+# depths as they go. Nothing is written unless asked for:
+#   METRICS_FILE=metrics.jsonl  one JSON line per timed event, plus a final snapshot
+#   METRICS_PORT=9100           Prometheus text format on http://host:port/metrics
+#   PROGRESS_INTERVAL=30        seconds between live progress lines (0 turns them off)
+
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_PORT = os.getenv('METRICS_PORT')
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 30))
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGES = ['scrape', 'download', 'render', 'encode', 'ocr', 'upload', 'db_read', 'db_write', 'corpus', 'ingest']
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """Peak resident set size of this process (or its children) in MB"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile: the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}    # (name, stage) -> value
+        self.gauges = {}      # (name, stage) -> value
+        self.latency = {}     # stage -> Histogram
+        self._file = None
+        self._started_outputs = False
+
+    def inc(self, name: str, stage: str, amount: float = 1):
+        with self._lock:
+            self.counters[(name, stage)] = self.counters.get((name, stage), 0) + amount
+
+    def add_bytes(self, stage: str, amount: int):
+        self.inc('bytes', stage, amount)
+
+    def set_gauge(self, name: str, stage: str, value: float):
+        with self._lock:
+            self.gauges[(name, stage)] = value
+
+    def queue_depth(self, stage: str, depth: int):
+        self.set_gauge('queue_depth', stage, depth)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self.latency.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def timed(self, stage: str, **fields):
+        """Time a unit of work; add 'bytes' (or anything else) to the yielded dict"""
+        span = dict(fields)
+        self.inc('in_flight', stage)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield span
+            ok = not span.get('error')
+        finally:
+            seconds = time.perf_counter() - start
+            self.inc('in_flight', stage, -1)
+            self.observe(stage, seconds)
+            self.inc('completed' if ok else 'errors', stage)
+            if span.get('bytes'):
+                self.add_bytes(stage, span['bytes'])
+            self._write({'ts': time.time(), 'stage': stage, 'seconds': round(seconds, 4), 'ok': ok, **span})
+
+    def _write(self, event: dict):
+        if not METRICS_FILE:
+            return
+        line = json.dumps(event, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(METRICS_FILE, 'a', encoding='utf-8')
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'uptime': round(time.time() - self.started, 1),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                'counters': {f"{name}:{stage}": value for (name, stage), value in self.counters.items()},
+                'gauges': {f"{name}:{stage}": value for (name, stage), value in self.gauges.items()},
+                'latency': {
+                    stage: {'count': hist.count, 'sum': round(hist.sum, 3),
+                            'p50': hist.quantile(0.5), 'p95': hist.quantile(0.95)}
+                    for stage, hist in self.latency.items()
+                },
+            }
+
+    def prometheus_text(self) -> str:
+        """Render everything in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            latency = sorted(self.latency.items())
+
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            # in_flight goes up and down, so it is really a gauge
+            kind = 'gauge' if name == 'in_flight' else 'counter'
+            suffix = '' if kind == 'gauge' else '_total'
+            lines.append(f"# TYPE jfk_{name}{suffix} {kind}")
+            for (metric, stage), value in counters:
+                if metric == name:
+                    lines.append(f'jfk_{name}{suffix}{{stage="{stage}"}} {value}')
+
+        for name in sorted({name for (name, _), _ in gauges}):
+            lines.append(f"# TYPE jfk_{name} gauge")
+            for (metric, stage), value in gauges:
+                if metric == name:
+                    lines.append(f'jfk_{name}{{stage="{stage}"}} {value}')
+
+        if latency:
+            lines.append("# TYPE jfk_stage_seconds histogram")
+        for stage, hist in latency:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist.buckets):
+                cumulative += count
+                lines.append(f'jfk_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'jfk_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+            lines.append(f'jfk_stage_seconds_sum{{stage="{stage}"}} {hist.sum}')
+            lines.append(f'jfk_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """One line per active stage: throughput, errors, latency, backlog"""
+        snap = self.snapshot()
+        elapsed = max(time.time() - self.started, 1e-3)
+        parts = []
+        for stage in STAGES + sorted(set(snap['latency']) - set(STAGES)):
+            done = snap['counters'].get(f"completed:{stage}", 0)
+            errors = snap['counters'].get(f"errors:{stage}", 0)
+            if not done and not errors:
+                continue
+            part = f"{stage} {done} ok/{errors} err {done / elapsed:.2f}/s"
+            lat = snap['latency'].get(stage)
+            if lat:
+                part += f" p50<={lat['p50']}s p95<={lat['p95']}s"
+            moved = snap['counters'].get(f"bytes:{stage}")
+            if moved:
+                part += f" {moved / 1_000_000:.1f}MB"
+            depth = snap['gauges'].get(f"queue_depth:{stage}")
+            if depth is not None:
+                part += f" queue {depth}"
+            parts.append(part)
+        return f"[{snap['uptime']:.0f}s] " + (' | '.join(parts) if parts else 'no work yet')
+
+    def start(self):
+        """Start whichever outputs are configured; safe to call more than once"""
+        with self._lock:
+            if self._started_outputs:
+                return
+            self._started_outputs = True
+
+        if METRICS_PORT:
+            self._serve(int(METRICS_PORT))
+        if PROGRESS_INTERVAL > 0:
+            threading.Thread(target=self._progress, name='metrics-progress', daemon=True).start()
+        atexit.register(self._finish)
+
+    def _serve(self, port: int):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        print(f"Serving metrics on http://localhost:{port}/metrics")
+
+    def _progress(self):
+        while True:
+            time.sleep(PROGRESS_INTERVAL)
+            print(self.summary(), flush=True)
+
+    def _finish(self):
+        print(self.summary())
+        self._write({'ts': time.time(), 'type': 'snapshot', **self.snapshot()})
+        if self._file is not None:
+            self._file.close()
+
+
+metrics = Metrics()
+timed = metrics.timed
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+# Cleans Gemini's transcriptions before they become RAG chunks or embeddings:
+# code fences, the NARA release banner and DocId footers on every page, bare
+# page numbers, runs of redaction markers, words hyphenated across lines and
+# runs of blank lines.
+#
+# The rules live in normalize-rules.json so frontend/scripts/normalize.js
+# applies exactly the same ones. They are compiled into a single alternation
+# with one named group per rule, so a page is rewritten in one pass however
+# many rules there are. Rules spell out their character classes ([0-9], [^\n],
+# (?<![^\n]) for a line start) instead of \d, \w, ., ^ or $, which mean
+# different things to Python and JavaScript; tests/test_normalize.py checks
+# that both give the same output.
+#
+#   python normalize.py                normalize ocr-text/*.txt in place
+#   python normalize.py --dry-run      just report what it would save
+
+RULES_PATH = Path(__file__).with_name('normalize-rules.json')
+NORMALIZE_WORKERS = int(os.getenv('NORMALIZE_WORKERS', os.cpu_count() or 1))
+
+# Items sent to a worker at a time, and tasks kept in flight per worker
+CHUNK_SIZE = 16
+IN_FLIGHT = 2
+
+# Rough token count: words and punctuation marks, close enough to compare runs
+TOKEN = re.compile(r'\w+|[^\w\s]')
+
+# CRLF and lone CR line endings, turned into \n before any rule runs
+LINE_ENDING = re.compile(r'\r\n?')
+
+
+def compile_rules(path: Path = RULES_PATH):
+    """One pattern for every rule, plus {group name: replacement}"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    flags = 0
+    for flag in config.get('flags', ''):
+        flags |= {'m': re.MULTILINE, 'i': re.IGNORECASE, 's': re.DOTALL}[flag]
+    pattern = '|'.join(f"(?P<{rule['name']}>{rule['pattern']})" for rule in config['rules'])
+    return re.compile(pattern, flags), {rule['name']: rule['replacement'] for rule in config['rules']}
+
+
+PATTERN, REPLACEMENTS = compile_rules()
+
+
+def normalize(text: str) -> Tuple[str, Counter]:
+    """Normalized text and how many times each rule fired"""
+    hits = Counter()
+
+    def replace(match):
+        hits[match.lastgroup] += 1
+        return REPLACEMENTS[match.lastgroup]
+
+    text = LINE_ENDING.sub('\n', text)
+    # Not a bare strip(), whose idea of whitespace differs from JavaScript's trim()
+    return PATTERN.sub(replace, text).strip(' \t\n') + '\n', hits
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN.findall(text))
+
+
+class Stats:
+    """Bytes, tokens and rule hits before and after normalization"""
+
+    def __init__(self):
+        self.items = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.hits = Counter()
+
+    def add(self, result: dict):
+        self.items += 1
+        self.bytes_in += result['bytes_in']
+        self.bytes_out += result['bytes_out']
+        self.tokens_in += result['tokens_in']
+        self.tokens_out += result['tokens_out']
+        self.hits.update(result['hits'])
+
+    def summary(self) -> str:
+        saved_bytes = self.bytes_in - self.bytes_out
+        saved_tokens = self.tokens_in - self.tokens_out
+        rules = ', '.join(f"{name} {count}" for name, count in self.hits.most_common())
+        return (f"Normalized {self.items} texts: {saved_bytes / 1_000_000:.2f} MB "
+                f"({saved_bytes / max(self.bytes_in, 1):.1%}) and ~{saved_tokens} tokens "
+                f"({saved_tokens / max(self.tokens_in, 1):.1%}) saved" + (f"; {rules}" if rules else ''))
+
+
+def normalize_chunk(items: list) -> list:
+    """Worker side: normalize (key, text) pairs and measure the difference"""
+    results = []
+    for key, text in items:
+        text = text or ''
+        cleaned, hits = normalize(text)
+        results.append({
+            'key': key,
+            'text': cleaned,
+            'bytes_in': len(text.encode('utf-8')),
+            'bytes_out': len(cleaned.encode('utf-8')),
+            'tokens_in': estimate_tokens(text),
+            'tokens_out': estimate_tokens(cleaned),
+            'hits': hits,
+        })
+    return results
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalize_stream(items: Iterable[Tuple[object, str]], stats: Stats = None,
+                     workers: int = NORMALIZE_WORKERS) -> Iterator[Tuple[object, str]]:
+    """Normalize (key, text) pairs across a process pool, yielding them in order
+
+    Input is read lazily and only a few chunks per worker are in flight, so
+    a slow producer (database reads) and a slow consumer (file writes) overlap
+    with the normalizing without the whole corpus ever sitting in memory.
+    """
+    stats = stats if stats is not None else Stats()
+    chunks = chunked(items, CHUNK_SIZE)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(normalize_chunk, chunk))
+            if len(pending) < workers * IN_FLIGHT:
+                continue
+            for result in pending.popleft().result():
+                stats.add(result)
+                yield result['key'], result['text']
+        while pending:
+            for result in pending.popleft().result():
+                stats.add(result)
+                yield result['key'], result['text']
+
+
+def normalize_corpus(directory: str = 'ocr-text', dry_run: bool = False) -> Stats:
+    """Normalize every corpus file in place"""
+    paths = sorted(Path(directory).glob('*.txt'))
+    stats = Stats()
+    texts = ((path, path.read_text(encoding='utf-8')) for path in paths)
+    for path, text in normalize_stream(texts, stats):
+        if not dry_run:
+            path.write_text(text, encoding='utf-8')
+    print(stats.summary())
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize OCR text files in place")
+    parser.add_argument('directory', nargs='?', default='ocr-text')
+    parser.add_argument('--dry-run', action='store_true', help="report the savings without rewriting anything")
+    args = parser.parse_args()
+    normalize_corpus(args.directory, args.dry_run)
@@ -0,0 +1,268 @@
+import argparse
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+from broker import Task, VISIBILITY_TIMEOUT, connect, throttle
+from clients import ledger
+from ledger import OCR, UPLOAD, PENDING, LEASED, DONE, ERROR, default_owner
+from metrics import metrics
+from ocr import OCR_WORKERS
+import db
+import releases
+
+ocr = importlib.import_module('gemini-page-ocr')
+
+# OCR spread over any number of processes and machines.
+#
+#   python ocr-worker.py coordinator [directory]   queue every page still to OCR
+#   python ocr-worker.py coordinator --watch       ...and report until the queue drains
+#   python ocr-worker.py worker                    lease, OCR, upload and ack pages
+#
+# The coordinator registers the PDFs in `directory` with the ledger, like
+# gemini-page-ocr.py does, and publishes every pending OCR job to the broker
+# named by BROKER_URL (see broker.py; workers on more than one machine need
+# Redis, as the ledger file can't be shared between hosts). Workers need the
+# same BROKER_URL and Supabase, Gemini and Cloudinary settings; PDFs they
+# don't have are downloaded from the record's pdf_link into PDF_DIR. Each worker keeps
+# OCR_WORKERS pages in flight, leases LEASE_BATCH at a time and extends its
+# leases while it holds them, so only a worker that dies loses its pages, and
+# only for VISIBILITY_TIMEOUT seconds.
+# Workers add throughput while Gemini's latency is what holds pages up, up to
+# Gemini's quota; pages are rendered locally, so workers sharing a busy CPU
+# add little (`python -m bench.run --stages workers --workers N` measures it).
+# Set OCR_RATE_LIMIT to the per-minute quota and the workers share it instead
+# of retrying into 429s.
+
+PDF_DIR = os.getenv('PDF_DIR', 'downloaded-pdfs')
+
+# How long an idle worker waits before asking the broker again
+POLL_SECONDS = float(os.getenv('POLL_SECONDS', 5))
+
+# Pages leased per trip to the broker, at most one per thread; the worker's
+# threads share them
+LEASE_BATCH = int(os.getenv('LEASE_BATCH', 5))
+
+# How often a worker refreshes the queue depth gauge
+GAUGE_SECONDS = float(os.getenv('GAUGE_SECONDS', 15))
+
+
+def record_results(broker):
+    """Mirror finished tasks from the broker into the coordinator's ledger"""
+    for task, error, uploaded in broker.collect():
+        if error:
+            ledger.fail(task.record_number, OCR, error, task.page)
+        else:
+            ledger.done(task.record_number, OCR, task.page)
+        if uploaded:
+            ledger.done(task.record_number, UPLOAD, task.page)
+
+
+def publish(broker, directory: str = PDF_DIR) -> int:
+    """Queue every pending OCR job, after registering the PDFs in directory"""
+    pdf_dir = Path(directory)
+    if pdf_dir.exists():
+        for pdf_file in sorted(pdf_dir.glob("*.pdf")):
+            try:
+                ocr.queue_pdf(str(pdf_file))
+            except Exception as e:
+                print(f"Error queueing {pdf_file}: {str(e)}")
+
+    tasks = []
+    skipped = set()
+    for record_number, page in ledger.find(OCR, (PENDING,)):
+        record = ledger.get_record(record_number)
+        if not record or not record['record_id']:
+            skipped.add(record_number)
+            continue
+        tasks.append(Task(record_number, page, record['record_id'], record['pdf_link']))
+    for record_number in sorted(skipped):
+        print(f"Skipping {record_number}: not in the ledger's record table")
+
+    published = broker.publish(tasks)
+    print(f"Published {published} of {len(tasks)} pending pages")
+    return published
+
+
+def watch(broker, interval: float = 30):
+    """Report progress until nothing is pending or leased"""
+    while True:
+        record_results(broker)
+        counts = broker.counts()
+        metrics.queue_depth('ocr', counts.get(PENDING, 0))
+        print(', '.join(f"{state}: {counts.get(state, 0)}" for state in (PENDING, LEASED, DONE, ERROR)))
+        if not counts.get(PENDING) and not counts.get(LEASED):
+            return
+        time.sleep(interval)
+
+
+class Worker:
+    """Leases pages from a broker on a pool of threads and keeps the leases alive"""
+
+    def __init__(self, broker, threads: int = OCR_WORKERS, pdf_dir: str = PDF_DIR,
+                 exit_when_empty: bool = False):
+        self.broker = broker
+        self.threads = threads
+        self.pdf_dir = pdf_dir
+        self.exit_when_empty = exit_when_empty
+        self.owner = default_owner()
+        self.active = set()
+        self.lock = threading.Lock()
+        self.leased = deque()
+        self.lease_lock = threading.Lock()
+        self.pdf_locks = {}
+        self.stopped = threading.Event()
+
+    def gauge(self):
+        while not self.stopped.wait(GAUGE_SECONDS):
+            try:
+                metrics.queue_depth('ocr', self.broker.counts().get(PENDING, 0))
+            except Exception as e:
+                print(f"Error reading the queue depth: {str(e)}")
+
+    def heartbeat(self):
+        while not self.stopped.wait(VISIBILITY_TIMEOUT / 3):
+            with self.lock:
+                tasks = list(self.active)
+            for task in tasks:
+                try:
+                    if not self.broker.extend(task, self.owner):
+                        print(f"Lost the lease on {task.record_number} page {task.page}")
+                except Exception as e:
+                    print(f"Error extending the lease on {task.record_number} page {task.page}: {str(e)}")
+
+    def pdf_path(self, task: Task) -> str:
+        """Local copy of a task's PDF, downloaded once per worker if it's missing"""
+        path = Path(self.pdf_dir) / f"{task.record_number}.pdf"
+        with self.lock:
+            lock = self.pdf_locks.setdefault(task.record_number, threading.Lock())
+        with lock:
+            if not path.exists():
+                if not task.pdf_link or not task.pdf_link.startswith('http'):
+                    raise Exception(f"No copy of {path.name} here and no URL to download it from")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                releases.download(task.pdf_link, self.pdf_dir)
+        return str(path)
+
+    def saved_page(self, task: Task) -> Optional[dict]:
+        """The page row, if a worker already wrote it but died before acking"""
+        rows = db.query('page', ['id', 'uploaded:cloudinary->>public_id'],
+                        {'parent_record_id': task.record_id, 'page_number': task.page, 'error': False})\
+            .limit(1).execute().data
+        return rows[0] if rows else None
+
+    def next_task(self) -> Optional[Task]:
+        """A leased task, fetching up to LEASE_BATCH more from the broker when this worker has none left"""
+        with self.lease_lock:
+            if not self.leased:
+                # No more than this worker has threads for, so a small worker
+                # doesn't sit on pages that idle workers could be doing
+                tasks = self.broker.lease(self.owner, min(LEASE_BATCH, self.threads))
+                # Kept alive by the heartbeat from now on, not just while processing
+                with self.lock:
+                    self.active.update(tasks)
+                self.leased.extend(tasks)
+            return self.leased.popleft() if self.leased else None
+
+    def process(self, task: Task):
+        thread_name = threading.current_thread().name
+        try:
+            saved = self.saved_page(task)
+            if saved:
+                print(f"{thread_name}: {task.record_number} page {task.page} is already in the database")
+                self.broker.ack(task, bool(saved.get('uploaded')))
+                return
+
+            pdf_path = self.pdf_path(task)
+            print(f"{thread_name}: Converting {task.record_number} page {task.page}")
+            # One slot of the shared rate limit per Gemini request, retries included
+            page_data, error = ocr.ocr_page(pdf_path, task.page, task.record_id, partial(throttle, self.broker))
+
+            if error:
+                if self.broker.nack(task, error):
+                    print(f"{thread_name}: Error processing {task.record_number} page {task.page}, will retry: {error}")
+                    return
+                # Out of attempts, so keep the error row for `recover` to find
+                if page_data:
+                    ocr.save_page(page_data)
+                print(f"{thread_name}: Error processing {task.record_number} page {task.page}: {error}")
+                return
+
+            ocr.save_page(page_data)
+            self.broker.ack(task, bool(page_data.get('cloudinary')))
+            print(f"{thread_name}: Successfully processed {task.record_number} page {task.page}")
+
+        except Exception as e:
+            print(f"{thread_name}: Error processing {task.record_number} page {task.page}: {str(e)}")
+            self.broker.nack(task, str(e))
+        finally:
+            with self.lock:
+                self.active.discard(task)
+
+    def work(self):
+        while not self.stopped.is_set():
+            task = self.next_task()
+            if task is None:
+                # Leased pages may still come back from a worker that died
+                if self.exit_when_empty and not any(self.broker.counts().get(state) for state in (PENDING, LEASED)):
+                    return
+                self.stopped.wait(POLL_SECONDS)
+                continue
+            self.process(task)
+
+    def run(self):
+        print(f"Worker {self.owner} running {self.threads} threads")
+        threading.Thread(target=self.heartbeat, daemon=True).start()
+        threading.Thread(target=self.gauge, daemon=True).start()
+        executor = ThreadPoolExecutor(max_workers=self.threads)
+        futures = [executor.submit(self.work) for _ in range(self.threads)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            print("Stopping once the pages in progress are done")
+        finally:
+            self.stopped.set()
+            executor.shutdown(wait=True)
+            # Hand back what was leased but never started
+            while self.leased:
+                self.broker.release(self.leased.popleft())
+
+
+def coordinate(directory: str = PDF_DIR, watch_queue: bool = False):
+    broker = connect()
+    publish(broker, directory)
+    if watch_queue:
+        watch(broker)
+    else:
+        record_results(broker)
+
+
+def work(threads: int = OCR_WORKERS, exit_when_empty: bool = False):
+    # Same pdftoppm environment fix as gemini-page-ocr.main
+    os.environ.pop('MallocStackLogging', None)
+    os.environ.pop('MallocStackLoggingNoCompact', None)
+    Worker(connect(), threads, exit_when_empty=exit_when_empty).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed OCR: queue pages, or work through the queue")
+    commands = parser.add_subparsers(dest='command', required=True)
+    coordinator = commands.add_parser('coordinator', help="publish every page still to OCR")
+    coordinator.add_argument('directory', nargs='?', default=PDF_DIR)
+    coordinator.add_argument('--watch', action='store_true', help="report progress until the queue drains")
+    worker = commands.add_parser('worker', help="lease, OCR and ack pages until stopped")
+    worker.add_argument('--threads', type=int, default=OCR_WORKERS)
+    worker.add_argument('--exit-when-empty', action='store_true', help="stop once nothing is pending or leased")
+    args = parser.parse_args()
+
+    metrics.start()
+    if args.command == 'coordinator':
+        coordinate(args.directory, args.watch)
+    else:
+        work(args.threads, args.exit_when_empty)
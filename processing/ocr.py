@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from clients import gemini
+from metrics import timed
+
+# Maximum number of Gemini requests in flight from this process. Every script
+# that OCRs goes through process_page, so they all share the same limit.
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 10))
+_ocr_slots = threading.BoundedSemaphore(OCR_WORKERS)
+
+PROMPT = """
+    Extract and transcribe the text content from this page.
+    Maintain the original structure but do not add any annotations.
+    """
+
+
+def process_page(image: object, page_num: int, pdf_link: str, record_id: str,
+                 before_request: Optional[Callable[[], None]] = None) -> Tuple[int, str]:
+    """Process a single page with Gemini; before_request runs ahead of every attempt, e.g. to wait for a rate limit"""
+    max_retries = 3
+    retry_delay = 1
+    
+    for attempt in range(max_retries):
+        try:
+            if before_request:
+                before_request()
+            with _ocr_slots, timed('ocr', page=page_num, attempt=attempt) as span:
+                response = gemini.generate_content([PROMPT, image])
+                span['bytes'] = len(response.text.encode('utf-8')) if response.text else 0
+                if not response.text:
+                    span['error'] = 'empty response'
+            
+            # Check if we got a valid response
+            if not response.text:
+                error_msg = "Copyright detection or empty response"
+                return page_num, error_msg, None
+            
+            return page_num, None, response.text
+            
+        except Exception as e:
+            if attempt == max_retries - 1:
+                return page_num, str(e), None
+            time.sleep(retry_delay * (attempt + 1))
@@ -0,0 +1,141 @@
+import math
+import re
+from collections import Counter
+from statistics import median
+from typing import Dict, Iterable, List
+
+# Cheap signals that a page's Gemini transcription went wrong, so re-OCR money
+# can go to the pages that need it. Every function here is pure and works on
+# plain dicts, so batches can be farmed out to a process pool.
+#
+# Each signal becomes a penalty in [0, 1]; a page's score is their weighted
+# sum, so 0 looks fine and 1 is as bad as it gets.
+
+WORDS = re.compile(r'[a-z]{2,}')
+FENCE = re.compile(r'^\s*```([A-Za-z0-9_-]*)\s*$', re.MULTILINE)
+
+# Pages with fewer words than this are too short to judge by vocabulary or
+# entropy; the length check still applies to them
+MIN_WORDS = 10
+
+# Normal English text sits at about 4.0-4.6 bits per character
+LOW_ENTROPY = 3.5
+HIGH_ENTROPY = 5.2
+
+# A transcription this many times longer or shorter than the ink suggests
+# gets the full length penalty
+LENGTH_FACTOR = 4.0
+
+WEIGHTS = {
+    'dictionary': 0.30,
+    'entropy': 0.15,
+    'length': 0.30,
+    'fences': 0.10,
+    'repeats': 0.15,
+}
+
+
+def clamp(value: float) -> float:
+    return max(0.0, min(1.0, value))
+
+
+def words(text: str) -> List[str]:
+    return WORDS.findall(text.lower())
+
+
+def document_frequencies(texts: Iterable[str]) -> Counter:
+    """How many of the texts each word appears in"""
+    counts = Counter()
+    for text in texts:
+        counts.update(set(words(text or '')))
+    return counts
+
+
+def entropy(text: str) -> float:
+    """Shannon entropy of the text's non-whitespace characters, in bits"""
+    counts = Counter(char for char in text if not char.isspace())
+    total = sum(counts.values())
+    if not total:
+        return 0.0
+    return -sum(n / total * math.log2(n / total) for n in counts.values())
+
+
+def fence_penalty(text: str) -> float:
+    """Markdown fences left in the transcription
+
+    A single ```text ... ``` wrapper is normal Gemini output and gets cleaned
+    up when the corpus is built, so it costs nothing. An opening fence with no
+    closing one usually means the response was cut off, and fences in the
+    middle of a page or for another language (```json, ```html) mean the
+    model reformatted the page.
+    """
+    fences = FENCE.findall(text)
+    if not fences:
+        return 0.0
+    if len(fences) % 2:
+        return 1.0
+    if len(fences) > 2 or fences[0] not in ('', 'text', 'plaintext'):
+        return 0.5
+    return 0.0
+
+
+def repeated_lines(text: str) -> float:
+    """Fraction of lines that repeat an earlier line, a sign of a generation loop"""
+    lines = [line.strip() for line in text.splitlines() if len(line.strip()) >= 10]
+    if len(lines) < 5:
+        return 0.0
+    return 1 - len(set(lines)) / len(lines)
+
+
+def page_features(pages: List[dict], vocabulary: frozenset) -> List[dict]:
+    """Per-page measurements for a batch of {'id', 'ocr_result', 'ink'} dicts"""
+    features = []
+    for page in pages:
+        text = page.get('ocr_result') or ''
+        page_words = words(text)
+        known = sum(1 for word in page_words if word in vocabulary)
+        features.append({
+            'id': page['id'],
+            'chars': len(text),
+            'words': len(page_words),
+            'dictionary': known / len(page_words) if page_words else 0.0,
+            'entropy': entropy(text),
+            'fences': fence_penalty(text),
+            'repeats': repeated_lines(text),
+            'ink': page.get('ink'),
+        })
+    return features
+
+
+def chars_per_ink(features: List[dict]) -> float:
+    """Typical transcription length per unit of ink across the corpus"""
+    ratios = [
+        feature['chars'] / feature['ink']
+        for feature in features
+        if feature['ink'] and feature['words'] >= MIN_WORDS
+    ]
+    return median(ratios) if ratios else 0.0
+
+
+def score(feature: dict, expected_ratio: float) -> Dict[str, float]:
+    """Penalties for one page and their weighted total under 'score'"""
+    penalties = {'fences': feature['fences']}
+
+    if feature['words'] >= MIN_WORDS:
+        penalties['dictionary'] = clamp((0.6 - feature['dictionary']) / 0.6)
+        penalties['entropy'] = clamp(max(
+            (LOW_ENTROPY - feature['entropy']) / 1.5,
+            (feature['entropy'] - HIGH_ENTROPY) / 1.0,
+        ))
+        penalties['repeats'] = clamp(feature['repeats'] * 2)
+
+    # A zero-ink page still gets checked: text on a blank page is exactly
+    # what this is here to catch
+    if feature['ink'] is not None and expected_ratio:
+        # Smoothed so near-blank pages with a line or two don't swing wildly
+        expected = expected_ratio * feature['ink']
+        mismatch = abs(math.log((feature['chars'] + 50) / (expected + 50)))
+        penalties['length'] = clamp(mismatch / math.log(LENGTH_FACTOR))
+
+    penalties['score'] = sum(WEIGHTS[name] * value for name, value in penalties.items())
+    return penalties
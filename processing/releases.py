@@ -0,0 +1,136 @@
+import json
+import os
+import re
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin
+import requests
+from bs4 import BeautifulSoup
+from metrics import timed
+
+# Where NARA publishes the files and which releases we've seen.
+#
+# Each release batch lives in its own folder, e.g. releases/2025/0318/ and
+# releases/2025/0403/, and a record re-released with fewer redactions keeps its
+# record number but moves to the newer folder. The local manifest remembers the
+# URL, size and ETag each record had at the last sync, plus the listing page's
+# own validators, so an unchanged release costs one conditional request.
+
+LISTING_URL = os.getenv('NARA_LISTING_URL', 'https://www.archives.gov/research/jfk/release-2025')
+RELEASES_URL = 'https://www.archives.gov/files/research/jfk/releases/'
+
+# Release used when a URL has to be made up for a file, e.g. by repair.py
+DEFAULT_RELEASE = os.getenv('NARA_RELEASE', '2025/0318')
+
+MANIFEST_PATH = os.getenv('MANIFEST_PATH', 'release-manifest.json')
+
+RELEASE_PATH = re.compile(r'/releases/((?:[^/]+/)*[^/]+)/[^/]+\.pdf$', re.IGNORECASE)
+
+
+def release_url(filename: str, release: str = DEFAULT_RELEASE) -> str:
+    """archives.gov URL of a file in a release folder"""
+    return f"{RELEASES_URL}{release.strip('/')}/{filename}"
+
+
+def release_of(url: str) -> Optional[str]:
+    """Release folder of a file URL, e.g. '2025/0318'"""
+    match = RELEASE_PATH.search(url)
+    return match.group(1) if match else None
+
+
+def record_number_of(url: str) -> str:
+    return url.split('/')[-1].replace('.pdf', '')
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    """{'listing': {...}, 'records': {record_number: {url, release, size, etag}}, 'failed': {record_number: url}}"""
+    if not os.path.exists(path):
+        return {'listing': {}, 'records': {}, 'failed': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    # Written to a temp file first so an interrupted sync can't leave half a manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def fetch_listing(listing: dict, url: str = LISTING_URL) -> Optional[str]:
+    """Fetch the listing page, or None if it hasn't changed since `listing` was saved
+
+    `listing` holds the ETag/Last-Modified of the previous fetch and is updated
+    in place with the new ones.
+    """
+    headers = {}
+    if listing.get('url') == url:
+        if listing.get('etag'):
+            headers['If-None-Match'] = listing['etag']
+        if listing.get('last_modified'):
+            headers['If-Modified-Since'] = listing['last_modified']
+
+    response = requests.get(url, headers=headers, timeout=60)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    listing.update({
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    })
+    return response.text
+
+
+def parse_listing(html: str, base_url: str = LISTING_URL) -> Dict[str, str]:
+    """{record_number: url} for every PDF linked from a listing page
+
+    The listing is a DataTables table that pages on the client, so the HTML
+    already holds every row. When a record is listed in more than one release
+    the newest one wins.
+    """
+    links = {}
+    for tag in BeautifulSoup(html, 'html.parser').find_all('a', href=True):
+        if not tag['href'].lower().endswith('.pdf'):
+            continue
+        url = urljoin(base_url, tag['href'])
+        record_number = record_number_of(url)
+        previous = links.get(record_number)
+        if previous is None or (release_of(url) or '') > (release_of(previous) or ''):
+            links[record_number] = url
+    return links
+
+
+def head(url: str) -> dict:
+    """Size and ETag of a file, without downloading it"""
+    response = requests.head(url, allow_redirects=True, timeout=60)
+    response.raise_for_status()
+    return file_info(url, response.headers)
+
+
+def download(url: str, directory: str) -> Tuple[str, dict]:
+    """Stream a file into directory, replacing any older copy; returns (path, response headers)"""
+    path = os.path.join(directory, url.split('/')[-1])
+    # Per process, so workers sharing the directory never write the same partial file
+    tmp_path = f"{path}.{os.getpid()}.part"
+    with timed('download', record=record_number_of(url)) as span:
+        response = requests.get(url, stream=True, timeout=300)
+        response.raise_for_status()
+        span['bytes'] = 0
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                f.write(chunk)
+                span['bytes'] += len(chunk)
+    os.replace(tmp_path, path)
+    return path, response.headers
+
+
+def file_info(url: str, headers) -> dict:
+    """Manifest entry for a file from its URL and HTTP response headers"""
+    size = headers.get('Content-Length')
+    return {
+        'url': url,
+        'release': release_of(url),
+        'size': int(size) if size else None,
+        'etag': headers.get('ETag'),
+    }
@@ -0,0 +1,267 @@
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from statistics import median
+from typing import List, Tuple
+from pdf2image import convert_from_path
+from PIL import Image
+from PyPDF2 import PdfReader
+from metrics import metrics, timed
+
+# Resolution used for the quick look at each page before the real render
+PROBE_DPI = 50
+
+# Bounds for the OCR render; the probe picks a value in between per page
+MIN_OCR_DPI = int(os.getenv('MIN_OCR_DPI', 150))
+MAX_OCR_DPI = int(os.getenv('MAX_OCR_DPI', 300))
+
+# Resolution of the image sent to Cloudinary for the web viewer
+UPLOAD_DPI = int(os.getenv('UPLOAD_DPI', 150))
+
+# Height in pixels we want a line of text to have in the OCR render. The
+# probe measures the dark band of each line, about its capital height, not
+# the line spacing, and the bench corpus's typescript measures 4-6px there:
+# this puts its smallest type at 250 DPI and ordinary type at 175-200 DPI.
+# Calibrated on render cost only; OCR accuracy at these sizes is untested.
+TARGET_LINE_PX = int(os.getenv('TARGET_LINE_PX', 20))
+
+# Upper bound on bitmap memory held by page renders at once, in MB. 0 means
+# no limit, though in-flight and peak bitmap memory are still tracked.
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', 0))
+
+# Pages with this much ink tend to have lines that touch, which makes the
+# measured line height unreliable, so they always get the full resolution
+DENSE_PAGE = 0.22
+
+# Pages with less ink than this are blank or close to it and get MIN_OCR_DPI
+BLANK_PAGE = 0.01
+
+
+def bitmap_bytes(image: Image) -> int:
+    """Size of an image's pixel buffer"""
+    return image.width * image.height * len(image.getbands())
+
+
+class MemoryBudget:
+    """Admits page renders only while their bitmaps fit in a byte budget
+
+    A render that is bigger than the whole budget is still let through once
+    nothing else is in flight, so one huge page can't stall a run.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.in_use = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        with self._cond:
+            while self.limit and self.in_use and self.in_use + nbytes > self.limit:
+                self._cond.wait()
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+            metrics.set_gauge('bitmap_bytes', 'render', self.in_use)
+            metrics.set_gauge('bitmap_peak_bytes', 'render', self.peak)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= nbytes
+                metrics.set_gauge('bitmap_bytes', 'render', self.in_use)
+                self._cond.notify_all()
+
+
+budget = MemoryBudget(MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+@lru_cache(maxsize=32)
+def page_sizes(pdf_path: str) -> List[Tuple[float, float]]:
+    """(width, height) of every page in PDF points"""
+    with open(pdf_path, 'rb') as pdf_file:
+        return [
+            (float(page.mediabox.width), float(page.mediabox.height))
+            for page in PdfReader(pdf_file).pages
+        ]
+
+
+def estimate_render_bytes(pdf_path: str, page_num: int, dpi: int) -> int:
+    """Memory an RGB render of a page will need, plus its web derivative and JPEG copy"""
+    width, height = page_sizes(pdf_path)[page_num - 1]
+    full = int(width * dpi / 72) * int(height * dpi / 72) * 3
+    derivative_scale = min(1.0, UPLOAD_DPI / dpi) ** 2
+    return int(full * (1 + 2 * derivative_scale))
+
+
+def measure_text(image: Image) -> Tuple[float, float]:
+    """Return (median text line height in pixels, ink density) for a probe render"""
+    gray = image.convert('L')
+    width, height = gray.size
+
+    # Trim the margins so scanner edges and punch holes don't count as text
+    gray = gray.crop((width // 20, height // 20, width - width // 20, height - height // 20))
+    width, height = gray.size
+
+    # Ink is dark pixels; squash to a single column to get mean ink per row
+    ink = gray.point(lambda v: 255 if v < 128 else 0)
+    rows = [value / 255 for value in ink.resize((1, height), Image.BOX).getdata()]
+    gray.close()
+    ink.close()
+
+    density = sum(rows) / len(rows) if rows else 0.0
+
+    # Rows noticeably darker than the background belong to a line of text
+    background = sorted(rows)[len(rows) // 10] if rows else 0.0
+    threshold = background + 0.03
+
+    lines = []
+    run = 0
+    for value in rows:
+        if value > threshold:
+            run += 1
+        elif run:
+            lines.append(run)
+            run = 0
+    if run:
+        lines.append(run)
+
+    # Ignore specks and anything tall enough to be a photo or a stamp
+    lines = [line for line in lines if 2 <= line <= height * 0.15]
+    if not lines:
+        return 0.0, density
+
+    return float(median(lines)), density
+
+
+def choose_ocr_dpi(line_height: float, density: float) -> int:
+    """Pick an OCR resolution from the text size and ink density of a probe"""
+    if density >= DENSE_PAGE:
+        return MAX_OCR_DPI
+
+    # Checked before the line height, which a speck or two on an otherwise
+    # blank page would otherwise turn into a tiny "line" and MAX_OCR_DPI
+    if density < BLANK_PAGE:
+        return MIN_OCR_DPI
+
+    if not line_height:
+        # Ink but no lines of text: photos and maps
+        return MAX_OCR_DPI
+
+    dpi = TARGET_LINE_PX * PROBE_DPI / line_height
+    # Round to a multiple of 25 so the renders are easy to compare
+    dpi = int(round(dpi / 25) * 25)
+    return max(MIN_OCR_DPI, min(MAX_OCR_DPI, dpi))
+
+
+def probe_page_dpi(pdf_path: str, page_num: int) -> int:
+    """Render a page at PROBE_DPI and pick the resolution to OCR it at"""
+    with timed('render', page=page_num, dpi=PROBE_DPI):
+        images = convert_from_path(
+            pdf_path,
+            dpi=PROBE_DPI,
+            first_page=page_num,
+            last_page=page_num,
+            thread_count=1,
+            grayscale=True,
+        )
+    if not images:
+        return MAX_OCR_DPI
+
+    line_height, density = measure_text(images[0])
+    images[0].close()
+    return choose_ocr_dpi(line_height, density)
+
+
+def render_page(pdf_path: str, page_num: int, dpi: int = None) -> Tuple[Image, int]:
+    """Render a single page, probing for the OCR resolution unless dpi is given"""
+    if dpi is None:
+        dpi = probe_page_dpi(pdf_path, page_num)
+
+    with timed('render', page=page_num, dpi=dpi) as span:
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=page_num,
+            last_page=page_num,
+            thread_count=1,
+        )
+        if images:
+            span['bytes'] = bitmap_bytes(images[0])
+    if not images:
+        return None, dpi
+    return images[0], dpi
+
+
+@contextmanager
+def rendered_page(pdf_path: str, page_num: int, dpi: int = None):
+    """Render a page inside the memory budget and close it on exit
+
+    Yields (image, dpi); image is None if pdftoppm produced nothing. The
+    bitmap is closed and its budget released as soon as the block ends, so
+    callers don't need to force a garbage collection to get the memory back.
+    """
+    if dpi is None:
+        dpi = probe_page_dpi(pdf_path, page_num)
+
+    with budget.reserve(estimate_render_bytes(pdf_path, page_num, dpi)):
+        image, dpi = render_page(pdf_path, page_num, dpi)
+        try:
+            yield image, dpi
+        finally:
+            if image is not None:
+                image.close()
+
+
+def web_derivative(image: Image, dpi: int) -> Image:
+    """Downscale an OCR render to UPLOAD_DPI for Cloudinary
+
+    Returns the original image when it is already at or below UPLOAD_DPI, so
+    callers should only close the result if it is not the image they passed in.
+    """
+    if dpi <= UPLOAD_DPI:
+        return image
+
+    scale = UPLOAD_DPI / dpi
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def page_runs(page_numbers) -> list:
+    """Split page numbers into (first, last) runs of consecutive pages"""
+    runs = []
+    for page_num in sorted(set(page_numbers)):
+        if runs and page_num == runs[-1][1] + 1:
+            runs[-1][1] = page_num
+        else:
+            runs.append([page_num, page_num])
+    return [tuple(run) for run in runs]
+
+
+def render_pages_to_files(pdf_path: str, page_numbers, dpi: int, output_folder: str) -> dict:
+    """Render several pages of one PDF to PNG files, one pdftoppm call per run
+
+    Returns {page_number: image path}. The bitmaps stay on disk until a caller
+    opens them, so a whole PDF can be rendered up front without holding every
+    page in memory.
+    """
+    paths = {}
+    for first, last in page_runs(page_numbers):
+        with timed('render', pages=last - first + 1, dpi=dpi) as span:
+            rendered = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                first_page=first,
+                last_page=last,
+                output_folder=output_folder,
+                output_file=f"run{first}_",
+                paths_only=True,
+                fmt='png',
+                thread_count=1,
+            )
+            span['bytes'] = sum(os.path.getsize(path) for path in rendered)
+        # pdftoppm writes the pages of a run in order
+        for page_num, path in zip(range(first, last + 1), sorted(rendered)):
+            paths[page_num] = path
+    return paths
@@ -0,0 +1,150 @@
+import argparse
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List
+from PyPDF2 import PdfReader
+from clients import ledger
+from metrics import metrics
+import db
+from releases import load_manifest, release_url
+
+# Single repair pass over the record and page tables, replacing the old
+# fix-record-number.py and fix-page-and-record-numbers.py scripts. Both tables
+# are loaded once, every fix is computed in memory against the local PDFs, and
+# only the fixed columns are PATCHed back, one request per distinct value (or
+# just printed with --dry-run).
+
+PDF_DIR = 'downloaded-pdfs'
+
+# Page images are uploaded as <record number>_page_<page number> (see upload.py)
+PUBLIC_ID = re.compile(r'_page_(\d+)$')
+
+
+@lru_cache(maxsize=None)
+def pdf_page_count(filename: str) -> int:
+    with open(os.path.join(PDF_DIR, filename), 'rb') as f:
+        return len(PdfReader(f).pages)
+
+
+def plan_record_fixes(records: List[dict], manifest: set, release_urls: Dict[str, str] = None) -> Dict[str, dict]:
+    """Compute link, record number and page count fixes for every record"""
+    release_urls = release_urls or {}
+    fixes = {}
+    for record in records:
+        pdf_link = record.get('pdf_link')
+        if not pdf_link:
+            continue
+        filename = pdf_link.split('/')[-1]
+        record_number = filename.replace('.pdf', '')
+        updates = {}
+
+        # Local paths that slipped in instead of the archives.gov URL
+        # (use the release the file was last synced from, see sync-release.py)
+        if pdf_link.startswith('downloaded-pdfs/'):
+            updates['pdf_link'] = release_urls.get(record_number) or release_url(filename)
+
+        if not record.get('record_number'):
+            updates['record_number'] = record_number
+
+        if filename in manifest:
+            try:
+                num_pages = pdf_page_count(filename)
+            except Exception as e:
+                print(f"Error reading {filename}: {str(e)}")
+                num_pages = None
+            if num_pages and not record.get('num_pages'):
+                updates['num_pages'] = num_pages
+            elif num_pages and record['num_pages'] != num_pages:
+                print(f"Warning: {record_number} has num_pages {record['num_pages']} but the PDF has {num_pages}")
+        elif not record.get('num_pages'):
+            print(f"Warning: PDF file not found for {filename}")
+
+        if updates:
+            fixes[record['id']] = updates
+    return fixes
+
+
+def plan_page_fixes(pages: List[dict], records_by_id: Dict[str, dict]) -> Dict[str, dict]:
+    """Compute missing page numbers from the public ID of each page's uploaded image"""
+    fixes = {}
+    for page in pages:
+        record = records_by_id.get(page['parent_record_id'])
+        if record is None:
+            print(f"Warning: page {page['id']} has no parent record")
+            continue
+        if not record.get('pdf_link'):
+            print(f"Warning: page {page['id']} belongs to record {record['id']}, which has no pdf_link")
+            continue
+        record_number = record['pdf_link'].split('/')[-1].replace('.pdf', '')
+
+        if page.get('page_number') is None:
+            match = PUBLIC_ID.search(page.get('public_id') or '')
+            if match and page['public_id'].split('/')[-1].startswith(f"{record_number}_page_"):
+                fixes[page['id']] = {'page_number': int(match.group(1))}
+            else:
+                print(f"Warning: page {page['id']} of {record_number} has no page number and no image to take one from")
+        elif record.get('num_pages') and int(page['page_number']) > record['num_pages']:
+            print(f"Warning: page {page['id']} is page {page['page_number']} of a {record['num_pages']} page record")
+    return fixes
+
+
+def print_diff(table: str, rows: Dict[str, dict], fixes: Dict[str, dict]):
+    for row_id, updates in fixes.items():
+        for column, value in updates.items():
+            print(f"{table} {row_id} {column}: {rows[row_id].get(column)!r} -> {value!r}")
+
+
+def apply_fixes(table: str, fixes: Dict[str, dict]):
+    """PATCH just the fixed columns, never inserting"""
+    written = db.update(table, fixes)
+    print(f"Updated {written} {table} rows")
+
+
+def repair(dry_run: bool = False):
+    records = db.fetch_all('record', ['id', 'record_number', 'pdf_link', 'num_pages'])
+    pages = db.fetch_all('page', ['id', 'parent_record_id', 'page_number', 'public_id:cloudinary->>public_id'])
+    print(f"Loaded {len(records)} records and {len(pages)} pages")
+
+    manifest = set(os.listdir(PDF_DIR)) if os.path.isdir(PDF_DIR) else set()
+    print(f"Found {len(manifest)} local PDFs")
+
+    records_by_id = {record['id']: record for record in records}
+    pages_by_id = {page['id']: page for page in pages}
+
+    release_urls = {
+        record_number: entry['url'] for record_number, entry in load_manifest()['records'].items()
+    }
+    record_fixes = plan_record_fixes(records, manifest, release_urls)
+    # Page checks should see the record fixes, e.g. a freshly filled num_pages
+    fixed_records = {
+        record_id: {**record, **record_fixes.get(record_id, {})}
+        for record_id, record in records_by_id.items()
+    }
+    page_fixes = plan_page_fixes(pages, fixed_records)
+
+    print_diff('record', records_by_id, record_fixes)
+    print_diff('page', pages_by_id, page_fixes)
+    print(f"{len(record_fixes)} record fixes, {len(page_fixes)} page fixes")
+
+    if dry_run:
+        print("Dry run, nothing written")
+        return
+
+    apply_fixes('record', record_fixes)
+    apply_fixes('page', page_fixes)
+
+    ledger.add_records([
+        (record['pdf_link'].split('/')[-1].replace('.pdf', ''), record_id, record['pdf_link'], record.get('num_pages'))
+        for record_id, record in fixed_records.items()
+        if record_id in record_fixes
+    ])
+    print("Finished repairing records")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair record and page rows in one pass")
+    parser.add_argument('--dry-run', action='store_true', help="print the fixes without writing them")
+    args = parser.parse_args()
+    metrics.start()
+    repair(dry_run=args.dry_run)
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+from clients import ledger
+from ledger import REOCR
+from metrics import metrics, timed
+import db
+import quality
+
+# Scores every page's OCR text and queues the worst ones for another pass.
+#
+#   python score-ocr.py                  score everything, queue pages over the threshold
+#   python score-ocr.py --limit 500      only queue the 500 worst pages
+#   python score-ocr.py --dry-run        write the ranking, don't touch the ledger
+#
+# The queue lands in the ledger's reocr stage (highest score leased first) and
+# in reocr-queue.csv; `python just-cloudinary.py --reocr` works through it.
+
+CHUNK_SIZE = 500
+SCORE_WORKERS = int(os.getenv('SCORE_WORKERS', os.cpu_count() or 1))
+REOCR_THRESHOLD = float(os.getenv('REOCR_THRESHOLD', 0.3))
+
+# Words in at least this many pages count as vocabulary. The collection is full
+# of agency jargon and names no stock dictionary has, so it is built from the
+# corpus itself; OCR garbage rarely repeats across pages.
+MIN_DOCUMENT_FREQUENCY = 5
+
+QUEUE_FILE = 'reocr-queue.csv'
+
+# NARA pages are letter or legal paper, both 8.5 inches across
+PAGE_WIDTH_INCHES = 8.5
+
+
+def chunks(items: list, size: int = CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ink_density(page: dict) -> Optional[float]:
+    """JPEG bytes per pixel of a page's uploaded image"""
+    if not (page.get('ink_bytes') and page.get('ink_width') and page.get('ink_height')):
+        return None
+    return int(page['ink_bytes']) / (int(page['ink_width']) * int(page['ink_height']))
+
+
+def resolution(page: dict) -> int:
+    """Approximate DPI of a page's uploaded image, to the nearest 50"""
+    short_side = min(int(page['ink_width']), int(page['ink_height']))
+    return int(round(short_side / PAGE_WIDTH_INCHES / 50) * 50)
+
+
+def ink_estimates(pages: List[dict]):
+    """Use the uploaded JPEG's size as a measure of how much ink a page has
+
+    JPEG size mostly tracks how much is printed on a page, but the images were
+    uploaded at different resolutions (300 DPI at first, 150 DPI since the
+    per-page DPI change and in recovery) and pages are letter or legal sized.
+    So size is taken per pixel and scaled by height / width, the page's area
+    in units of its width squared. Bytes per pixel still aren't comparable
+    across resolutions (text at 150 DPI takes nearly twice the bytes per pixel
+    it does at 300), so pages are grouped by resolution under 'ink_group', and
+    each group gets its own blank baseline here and its own chars-per-ink
+    ratio in length_ratios().
+    """
+    groups = defaultdict(list)
+    for page in pages:
+        page['ink'] = None
+        page['ink_group'] = None
+        density = ink_density(page)
+        if density is not None:
+            page['ink_group'] = resolution(page)
+            groups[page['ink_group']].append((page, density))
+
+    for members in groups.values():
+        # The emptiest pages' density is paper texture and scanner noise
+        ordered = sorted(density for _, density in members)
+        blank = ordered[len(ordered) // 20]
+        for page, density in members:
+            page['ink'] = max(0.0, density - blank) * int(page['ink_height']) / int(page['ink_width'])
+
+
+def length_ratios(features: List[dict], pages_by_id: Dict[str, dict]) -> Dict[Optional[int], float]:
+    """Typical chars per unit of ink for each resolution group"""
+    groups = defaultdict(list)
+    for feature in features:
+        groups[pages_by_id[feature['id']].get('ink_group')].append(feature)
+    return {group: quality.chars_per_ink(members) for group, members in groups.items()}
+
+
+def score_pages():
+    """Fetch all OCR text and return every page's scores, worst first"""
+    records = db.fetch_all('record', ['id', 'pdf_link'])
+    record_numbers = {
+        record['id']: record['pdf_link'].split('/')[-1].replace('.pdf', '')
+        for record in records
+        if record.get('pdf_link')
+    }
+    pages = db.fetch_all(
+        'page',
+        ['id', 'parent_record_id', 'page_number', 'ocr_result', 'ink_bytes:cloudinary->>bytes',
+         'ink_width:cloudinary->>width', 'ink_height:cloudinary->>height'],
+        error=False,
+    )
+    # Rows without a page number can't be queued by page; repair.py fills them in
+    unnumbered = [page for page in pages if page.get('page_number') is None]
+    if unnumbered:
+        print(f"Skipping {len(unnumbered)} pages with no page number, run repair.py to fix them")
+        pages = [page for page in pages if page.get('page_number') is not None]
+    print(f"Scoring {len(pages)} pages from {len(records)} records with {SCORE_WORKERS} processes")
+    ink_estimates(pages)
+
+    with ProcessPoolExecutor(max_workers=SCORE_WORKERS) as executor:
+        with timed('score', pages=len(pages)):
+            frequencies = sum(
+                executor.map(quality.document_frequencies,
+                             ([page['ocr_result'] for page in chunk] for chunk in chunks(pages))),
+                start=Counter()
+            )
+            vocabulary = frozenset(
+                word for word, count in frequencies.items() if count >= MIN_DOCUMENT_FREQUENCY
+            )
+            print(f"Vocabulary: {len(vocabulary)} words")
+
+            # Workers only need the fields that are scored
+            slim = ({'id': page['id'], 'ocr_result': page['ocr_result'], 'ink': page.get('ink')}
+                    for page in pages)
+            features = [
+                feature
+                for batch in executor.map(partial(quality.page_features, vocabulary=vocabulary),
+                                          chunks(list(slim)))
+                for feature in batch
+            ]
+
+    pages_by_id = {page['id']: page for page in pages}
+    ratios = length_ratios(features, pages_by_id)
+    scored = []
+    for feature in features:
+        page = pages_by_id[feature['id']]
+        scored.append({
+            'record_number': record_numbers.get(page['parent_record_id']),
+            'page_number': int(page['page_number']),
+            'page_id': page['id'],
+            **quality.score(feature, ratios[page.get('ink_group')]),
+        })
+    scored.sort(key=lambda row: row['score'], reverse=True)
+    return scored
+
+
+def write_queue(queue: List[dict], path: str = QUEUE_FILE):
+    columns = ['rank', 'score', 'record_number', 'page_number', 'page_id', *quality.WEIGHTS]
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for rank, row in enumerate(queue, 1):
+            writer.writerow({
+                'rank': rank,
+                **{key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()},
+            })
+
+
+def main(limit: int = None, threshold: float = None, dry_run: bool = False):
+    threshold = REOCR_THRESHOLD if threshold is None else threshold
+    scored = score_pages()
+    queue = [row for row in scored if row['score'] >= threshold and row['record_number']]
+    if limit:
+        queue = queue[:limit]
+
+    write_queue(queue)
+    print(f"{len(queue)} of {len(scored)} pages scored {threshold} or worse, ranking written to {QUEUE_FILE}")
+    for row in queue[:10]:
+        reasons = ', '.join(f"{name} {row[name]:.2f}" for name in quality.WEIGHTS if row.get(name, 0) >= 0.5)
+        print(f"  {row['score']:.2f}  {row['record_number']} page {row['page_number']}  {reasons}")
+
+    if dry_run:
+        print("Dry run, ledger not updated")
+        return
+    ledger.enqueue(REOCR, [(row['record_number'], row['page_number'], row['score']) for row in queue])
+    print(f"Queued {len(queue)} pages for re-OCR")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score OCR quality and queue bad pages for re-OCR")
+    parser.add_argument('--limit', type=int, help="queue at most this many pages, worst first")
+    parser.add_argument('--threshold', type=float, default=REOCR_THRESHOLD,
+                        help="minimum score (0 good, 1 bad) to queue a page")
+    parser.add_argument('--dry-run', action='store_true', help="write the ranking without queueing anything")
+    args = parser.parse_args()
+    metrics.start()
+    main(args.limit, args.threshold, args.dry_run)
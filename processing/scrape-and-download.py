@@ -8,48 +8,29 @@ from selenium.webdriver.support import expected_conditions as EC
 from urllib.parse import urljoin
 from queue import Queue
 from threading import Thread
-from supabase import create_client, Client
-from dotenv import load_dotenv
 import time
 from PyPDF2 import PdfReader
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Create downloaded-pdfs directory if it doesn't exist
-if not os.path.exists('downloaded-pdfs'):
-    os.makedirs('downloaded-pdfs')
+from clients import supabase, ledger
+from metrics import metrics, timed
+from ledger import DOWNLOAD, DONE
 
 # Initialize queue for URLs
 url_queue = Queue()
 
-# Set up headless Chrome driver
-options = webdriver.ChromeOptions()
-options.add_argument('--headless')
-options.add_argument('--no-sandbox')
-options.add_argument('--disable-dev-shm-usage')
-options.add_argument('--disable-gpu')
-options.add_argument('--disable-software-rasterizer')
-options.add_argument('--ignore-certificate-errors')
-options.add_argument('--ignore-ssl-errors')
-options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-
-# Create a driver pool
 NUM_WORKERS = 3  # Number of parallel workers
-drivers = []
-try:
-    for _ in range(NUM_WORKERS):
-        drivers.append(webdriver.Chrome(options=options))
-except Exception as e:
-    print(f"Error initializing Chrome driver: {str(e)}")
-    for d in drivers:
-        d.quit()
-    exit(1)
-
-# Supabase client setup
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+
+def chrome_options():
+    """Options for the headless Chrome drivers"""
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-software-rasterizer')
+    options.add_argument('--ignore-certificate-errors')
+    options.add_argument('--ignore-ssl-errors')
+    options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+    return options
 
 def process_url(driver, url, parent_page_num):
     try:
@@ -59,10 +40,14 @@ def process_url(driver, url, parent_page_num):
         filename = url.split('/')[-1]
         record_number = filename.replace('.pdf', '')
         
-        # Check if the record already exists in the database
+        # Check the local ledger first, then the database
+        if ledger.state(record_number, DOWNLOAD) == DONE:
+            print(f"Record {record_number} already downloaded. Skipping download.")
+            return
         existing_records = supabase.table("record").select("record_number").eq("record_number", record_number).execute()
         if existing_records.data:
             print(f"Record {record_number} already exists in the database. Skipping download.")
+            ledger.done(record_number, DOWNLOAD)
             return
         
         # Check if the PDF already exists in the downloaded-pdfs directory
@@ -72,14 +57,19 @@ def process_url(driver, url, parent_page_num):
             print(f"File {filename} exists but not in database. Adding to database...")
             
         # Always try to download if not in database
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            if not os.path.exists(filepath):
+        with timed('download', record=record_number) as span:
+            response = requests.get(url, stream=True)
+            if response.status_code != 200:
+                span['error'] = response.status_code
+            elif not os.path.exists(filepath):
+                span['bytes'] = 0
                 with open(filepath, 'wb') as f:
                     for chunk in response.iter_content(chunk_size=8192):
                         if chunk:
                             f.write(chunk)
+                            span['bytes'] += len(chunk)
                 print(f"Downloaded: {filename}")
+        if response.status_code == 200:
             
             # Get the number of pages in the PDF
             with open(filepath, 'rb') as f:
@@ -95,8 +85,13 @@ def process_url(driver, url, parent_page_num):
                 "num_pages": num_pages
             }
             try:
-                supabase.table("record").insert(data).execute()
+                with timed('db_write', record=record_number):
+                    inserted = supabase.table("record").insert(data).execute()
                 print(f"Added {record_number} to database")
+                
+                # Queue up the rest of the pipeline for this record
+                ledger.add_record(record_number, inserted.data[0]['id'], url, num_pages)
+                ledger.queue_pipeline(record_number, num_pages)
             except Exception as e:
                 print(f"Error adding to database: {str(e)}")
         else:
@@ -119,7 +114,7 @@ def process_page(driver, page_url, parent_page_num):
 
 def process_files():
     main_url = 'https://www.archives.gov/research/jfk/release-2025'
-    driver = webdriver.Chrome(options=options)
+    driver = webdriver.Chrome(options=chrome_options())
     driver.get(main_url)
     
     current_page_number = 1
@@ -131,11 +126,13 @@ def process_files():
             )
             
             # Find all PDF links in the current page and add to queue
-            for link in driver.find_elements(By.TAG_NAME, "a"):
-                href = link.get_attribute('href')
-                if href and href.endswith('.pdf'):
-                    url_queue.put((href, current_page_number))
-                    print(f"Added to queue: {href}")
+            with timed('scrape', page=current_page_number):
+                for link in driver.find_elements(By.TAG_NAME, "a"):
+                    href = link.get_attribute('href')
+                    if href and href.endswith('.pdf'):
+                        url_queue.put((href, current_page_number))
+                        print(f"Added to queue: {href}")
+            metrics.queue_depth('download', url_queue.qsize())
             
             # Wait for all downloads from this page to complete
             url_queue.join()
@@ -156,37 +153,60 @@ def process_files():
 
     driver.quit()
 
-def worker(driver_index):
-    driver = drivers[driver_index]
+def worker(driver):
     while True:
         item = url_queue.get()
         if item is None:
+            url_queue.task_done()
             break
         url, parent_page_num = item
         process_url(driver, url, parent_page_num)
         url_queue.task_done()
+        metrics.queue_depth('download', url_queue.qsize())
         # Reduced sleep time
         time.sleep(1)
 
-# Start multiple worker threads
-worker_threads = []
-for i in range(NUM_WORKERS):
-    thread = Thread(target=worker, args=(i,))
-    thread.start()
-    worker_threads.append(thread)
+def main():
+    # Create downloaded-pdfs directory if it doesn't exist
+    if not os.path.exists('downloaded-pdfs'):
+        os.makedirs('downloaded-pdfs')
 
-# Start processing files indefinitely
-process_files()
+    # Create a driver pool
+    options = chrome_options()
+    drivers = []
+    try:
+        for _ in range(NUM_WORKERS):
+            drivers.append(webdriver.Chrome(options=options))
+    except Exception as e:
+        print(f"Error initializing Chrome driver: {str(e)}")
+        for d in drivers:
+            d.quit()
+        exit(1)
 
-# Add sentinel value for each worker
-for _ in range(NUM_WORKERS):
-    url_queue.put(None)
+    metrics.start()
 
-# Wait for all tasks to complete
-url_queue.join()
-for thread in worker_threads:
-    thread.join()
+    # Start multiple worker threads
+    worker_threads = []
+    for driver in drivers:
+        thread = Thread(target=worker, args=(driver,))
+        thread.start()
+        worker_threads.append(thread)
 
-# Clean up all drivers
-for driver in drivers:
-    driver.quit()
+    # Start processing files indefinitely
+    process_files()
+
+    # Add sentinel value for each worker
+    for _ in range(NUM_WORKERS):
+        url_queue.put(None)
+
+    # Wait for all tasks to complete
+    url_queue.join()
+    for thread in worker_threads:
+        thread.join()
+
+    # Clean up all drivers
+    for driver in drivers:
+        driver.quit()
+
+if __name__ == "__main__":
+    main()
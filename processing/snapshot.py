@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Tuple
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pyarrow import fs
+import db
+from clients import supabase
+from metrics import metrics, timed
+
+# Local columnar copy of the record and page tables.
+#
+#   python snapshot.py export [--format arrow]   dump both tables to SNAPSHOT_DIR
+#   python snapshot.py info                      what's in the current snapshot
+#
+# Pages are written zstd-compressed, one file per record
+# (page/record_number=<n>/part-0.<ext>), with embeddings as fixed-size float32
+# lists. Snapshot reads them back memory-mapped; with DB_SNAPSHOT=<dir> set,
+# db.paged() serves table scans from it instead of Supabase, so corpus builds,
+# repair passes and scoring run at disk speed. Writes still go to Supabase.
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshot')
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 8))
+
+FORMATS = ['parquet', 'arrow']
+
+# Size of the gte-small vectors frontend/scripts/generate-embeddings.js stores
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', 384))
+
+RECORD_COLUMNS = ['id', 'record_number', 'pdf_link', 'result_page', 'parent_page_num', 'num_pages', 'in_anything_llm']
+PAGE_COLUMNS = ['id', 'parent_record_id', 'page_number', 'ocr_result', 'error', 'cloudinary', 'embedding', 'updated_at']
+
+RECORD_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('record_number', pa.string()),
+    ('pdf_link', pa.string()),
+    ('result_page', pa.int32()),
+    ('parent_page_num', pa.int32()),
+    ('num_pages', pa.int32()),
+    ('in_anything_llm', pa.bool_()),
+])
+
+# Partition values are record numbers, which must stay strings
+PARTITIONING = ds.partitioning(pa.schema([('record_number', pa.string())]), flavor='hive')
+
+EMBED = re.compile(r'^(?:(\w+):)?(\w+)\(([^)]*)\)$')
+JSON_PATH = re.compile(r'^(?:(\w+):)?(\w+)->>(\w+)$')
+
+
+def page_schema(embedding_dim: int) -> pa.Schema:
+    return pa.schema([
+        ('id', pa.string()),
+        ('parent_record_id', pa.string()),
+        ('page_number', pa.int32()),
+        ('ocr_result', pa.string()),
+        ('error', pa.bool_()),
+        # Kept as JSON text; only a few fields are ever read back
+        ('cloudinary', pa.string()),
+        ('embedding', pa.list_(pa.float32(), embedding_dim)),
+        ('updated_at', pa.string()),
+    ])
+
+
+def parse_embedding(value) -> list:
+    # PostgREST returns pgvector columns as '[0.1,0.2,...]'
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def page_table(pages: List[dict], schema: pa.Schema) -> pa.Table:
+    columns = {name: [page.get(name) for page in pages] for name in schema.names}
+    columns['page_number'] = [int(value) if value is not None else None for value in columns['page_number']]
+    columns['cloudinary'] = [json.dumps(value) if value is not None else None for value in columns['cloudinary']]
+    columns['embedding'] = [parse_embedding(value) for value in columns['embedding']]
+    return pa.table(columns, schema=schema)
+
+
+def partition_name(record: dict) -> str:
+    """record_number of a record row, or its PDF's name for rows repair.py hasn't filled in"""
+    if record.get('record_number'):
+        return record['record_number']
+    return record['pdf_link'].split('/')[-1].replace('.pdf', '') if record.get('pdf_link') else None
+
+
+def write(table: pa.Table, path: Path, fmt: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == 'arrow':
+        feather.write_feather(table, str(path), compression='zstd')
+    else:
+        pq.write_table(table, str(path), compression='zstd')
+
+
+def export(path: str = SNAPSHOT_DIR, fmt: str = 'parquet', client=None):
+    """Dump record and page to a fresh snapshot, replacing the old one when done"""
+    started = time.time()
+    # Always read the live tables, even when DB_SNAPSHOT points at the old snapshot
+    client = client or supabase.get()
+    tmp = Path(f"{path}.tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+
+    records = db.fetch_all('record', RECORD_COLUMNS, client=client)
+    write(pa.Table.from_pylist(records, schema=RECORD_SCHEMA), tmp / f"record.{fmt}", fmt)
+    print(f"Exported {len(records)} records")
+
+    schema = page_schema(EMBEDDING_DIM)
+    (tmp / 'page').mkdir()
+    partitions = {}
+    for record in records:
+        partitions[record['id']] = partition_name(record)
+        if not partitions[record['id']]:
+            print(f"Skipping record {record['id']}: no record number or pdf_link")
+
+    def export_record(record_number: str, pages: List[dict]) -> int:
+        pages.sort(key=lambda page: (page['page_number'] is None, int(page['page_number'] or 0)))
+        partition = tmp / 'page' / f"record_number={record_number}" / f"part-0.{fmt}"
+        with timed('snapshot', record=record_number) as span:
+            write(page_table(pages, schema), partition, fmt)
+            span['bytes'] = partition.stat().st_size
+        return len(pages)
+
+    page_count = 0
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as executor:
+        # Partitions are written on the pool while the scan carries on, with
+        # only a few records' pages held in memory at once
+        pending = deque()
+
+        def submit(record_id: str, pages: List[dict]):
+            nonlocal page_count, skipped
+            if not partitions.get(record_id):
+                skipped += len(pages)
+                return
+            pending.append(executor.submit(export_record, partitions[record_id], pages))
+            while len(pending) > EXPORT_WORKERS * 2:
+                page_count += pending.popleft().result()
+
+        # One scan of the whole page table, ordered so each record's pages
+        # arrive together and are written as soon as the next record starts
+        current, pages = None, []
+        for page in db.paged('page', PAGE_COLUMNS, order='parent_record_id,id', client=client):
+            if pages and page['parent_record_id'] != current:
+                submit(current, pages)
+                pages = []
+            current = page['parent_record_id']
+            pages.append(page)
+        if pages:
+            submit(current, pages)
+        while pending:
+            page_count += pending.popleft().result()
+    if skipped:
+        print(f"Skipped {skipped} pages whose record is missing or has no record number")
+
+    with open(tmp / 'manifest.json', 'w') as f:
+        json.dump({
+            'format': fmt,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'records': len(records),
+            'pages': page_count,
+            'embedding_dim': EMBEDDING_DIM,
+        }, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    print(f"Exported {page_count} pages to {path} in {time.time() - started:.0f}s")
+
+
+class Snapshot:
+    """Memory-mapped reader for an exported snapshot"""
+
+    def __init__(self, path: str = SNAPSHOT_DIR):
+        self.path = Path(path)
+        with open(self.path / 'manifest.json') as f:
+            self.info = json.load(f)
+        self.format = self.info['format']
+        self._filesystem = fs.LocalFileSystem(use_mmap=True)
+        self._datasets = {}
+        self._partitions = None
+
+    def dataset(self, table: str) -> ds.Dataset:
+        if table not in self._datasets:
+            fmt = 'ipc' if self.format == 'arrow' else 'parquet'
+            if table == 'record':
+                source = str(self.path / f"record.{self.format}")
+                self._datasets[table] = ds.dataset(source, format=fmt, filesystem=self._filesystem)
+            elif table == 'page':
+                self._datasets[table] = ds.dataset(
+                    str(self.path / 'page'), format=fmt, filesystem=self._filesystem, partitioning=PARTITIONING
+                )
+            else:
+                raise KeyError(f"{table} is not in the snapshot")
+        return self._datasets[table]
+
+    def partitions(self) -> dict:
+        """{record id: record_number partition} for every record"""
+        if self._partitions is None:
+            records = self.table('record', ['id', 'record_number', 'pdf_link']).to_pylist()
+            self._partitions = {record['id']: partition_name(record) for record in records}
+        return self._partitions
+
+    def record_files(self, record_ids) -> List[str]:
+        """Page files of the given records, found from their ids without listing the others"""
+        files = []
+        for record_id in record_ids:
+            record_number = self.partitions().get(record_id)
+            path = self.path / 'page' / f"record_number={record_number}" / f"part-0.{self.format}"
+            if record_number and path.exists():
+                files.append(str(path))
+        return files
+
+    def table(self, table: str, columns: List[str] = None, **filters) -> pa.Table:
+        """Arrow table of the matching rows; list, tuple and set filter values mean 'any of'"""
+        dataset = self.dataset(table)
+        if table == 'page' and 'parent_record_id' in filters:
+            # Pages are partitioned by record number, so open just those records'
+            # files instead of having every file checked for the record id
+            record_ids = filters['parent_record_id']
+            if not isinstance(record_ids, (list, tuple, set, frozenset)):
+                record_ids = [record_ids]
+            files = self.record_files(record_ids)
+            if not files:
+                return dataset.schema.empty_table().select(columns) if columns else dataset.schema.empty_table()
+            dataset = ds.dataset(
+                files, format=dataset.format, filesystem=self._filesystem, partitioning=PARTITIONING,
+                partition_base_dir=str(self.path / 'page'), schema=dataset.schema
+            )
+
+        condition = None
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set, frozenset)):
+                term = ds.field(column).isin(list(value))
+            elif value is None:
+                term = ds.field(column).is_null()
+            else:
+                term = ds.field(column) == value
+            condition = term if condition is None else condition & term
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def rows(self, table: str, columns: List[str], order: str = 'id', **filters) -> Iterator[dict]:
+        """Rows as dicts, taking the same column specs as a PostgREST select()
+
+        Supports plain and aliased columns, `alias:column->>key` on JSON columns
+        and `alias:record(columns)` embeds of the parent record.
+        """
+        plan = []
+        needed = set()
+        for spec in columns:
+            embed = EMBED.match(spec)
+            path = JSON_PATH.match(spec)
+            if embed:
+                alias, parent, fields = embed.groups()
+                plan.append(('embed', alias or parent, parent, [f.strip() for f in fields.split(',') if f.strip()]))
+                needed.add(f"parent_{parent}_id")
+            elif path:
+                alias, source, key = path.groups()
+                plan.append(('json', alias or key, source, key))
+                needed.add(source)
+            else:
+                alias, _, name = spec.rpartition(':')
+                plan.append(('column', alias or name, name, None))
+                needed.add(name)
+
+        keys = order.split(',')
+        data = self.table(table, sorted(needed | set(keys)), **filters).sort_by([(key, 'ascending') for key in keys])
+        parents = {}
+        for kind, _, parent, fields in plan:
+            if kind == 'embed':
+                parent_rows = self.table(parent, sorted(set(fields) | {'id'})).to_pylist()
+                parents[parent] = {row['id']: row for row in parent_rows}
+
+        for batch in data.to_batches():
+            for row in batch.to_pylist():
+                result = {}
+                for kind, alias, source, extra in plan:
+                    if kind == 'embed':
+                        parent = parents[source].get(row[f"parent_{source}_id"])
+                        result[alias] = {field: parent[field] for field in extra} if parent else None
+                    elif kind == 'json':
+                        value = json.loads(row[source]) if row[source] else {}
+                        found = value.get(extra) if isinstance(value, dict) else None
+                        result[alias] = None if found is None else str(found)
+                    elif source == 'cloudinary' and row[source] is not None:
+                        result[alias] = json.loads(row[source])
+                    else:
+                        result[alias] = row[source]
+                yield result
+
+    def embeddings(self, **filters) -> Tuple[List[str], object]:
+        """(page ids, float32 matrix with one row per page) for pages that have an embedding"""
+        data = self.table('page', ['id', 'embedding'], **filters)
+        data = data.filter(data['embedding'].is_valid())
+        vectors = data['embedding'].combine_chunks()
+        matrix = vectors.flatten().to_numpy().reshape(len(vectors), self.info['embedding_dim'])
+        return data['id'].to_pylist(), matrix
+
+
+def print_info(path: str = SNAPSHOT_DIR):
+    snapshot = Snapshot(path)
+    size = sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+    print(f"{path}: {snapshot.info['records']} records, {snapshot.info['pages']} pages, "
+          f"{snapshot.format}/zstd, {size / 1_000_000:.1f} MB, taken {snapshot.info['created_at']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or inspect a local snapshot of the record and page tables")
+    parser.add_argument('command', nargs='?', default='info', choices=['export', 'info'])
+    parser.add_argument('--path', default=SNAPSHOT_DIR)
+    parser.add_argument('--format', default='parquet', choices=FORMATS)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        metrics.start()
+        export(args.path, args.format)
+    print_info(args.path)
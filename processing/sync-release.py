@@ -0,0 +1,226 @@
+import argparse
+import importlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+from PyPDF2 import PdfReader
+from clients import supabase, ledger
+from metrics import metrics, timed
+import db
+import releases
+
+# Brings the database up to date with the NARA listing, touching only what changed.
+#
+#   python sync-release.py              diff, download, then OCR/corpus/ingest the delta
+#   python sync-release.py --dry-run    just print what is new or changed
+#   python sync-release.py --verify     also HEAD every known file to catch in-place replacements
+#
+# The listing is diffed against the local manifest (releases.MANIFEST_PATH)
+# first, and only records whose URL moved or that we've never seen are checked
+# against the database, so re-running against an unchanged release takes one
+# conditional GET.
+
+PDF_DIR = 'downloaded-pdfs'
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 4))
+
+
+def fetch_records() -> Dict[str, dict]:
+    """{record_number: row} for every record in the database"""
+    by_number = {}
+    for record in db.paged('record', ['id', 'record_number', 'pdf_link']):
+        record_number = record.get('record_number') or \
+            (releases.record_number_of(record['pdf_link']) if record.get('pdf_link') else None)
+        if record_number:
+            by_number[record_number] = record
+    return by_number
+
+
+def verify_files(links: Dict[str, str], known: dict) -> List[str]:
+    """Record numbers whose file changed size or ETag under the same URL"""
+    def check(item):
+        record_number, url = item
+        try:
+            return record_number, releases.head(url)
+        except Exception as e:
+            print(f"Error checking {url}: {str(e)}")
+            return record_number, None
+
+    changed = []
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        for record_number, info in executor.map(check, links.items()):
+            previous = known.get(record_number)
+            if not info or not previous or previous.get('url') != info['url']:
+                continue
+            if any(previous.get(key) and info[key] and previous[key] != info[key] for key in ('size', 'etag')):
+                changed.append(record_number)
+            known[record_number] = {**previous, **{key: value for key, value in info.items() if value}}
+    return changed
+
+
+def download(url: str) -> dict:
+    """Download a PDF into PDF_DIR, replacing any older copy, and return its manifest entry"""
+    path, headers = releases.download(url, PDF_DIR)
+    with open(path, 'rb') as f:
+        num_pages = len(PdfReader(f).pages)
+    return {**releases.file_info(url, headers), 'num_pages': num_pages}
+
+
+def add_new_records(entries: Dict[str, dict]):
+    """Insert rows for records the database has never seen"""
+    rows = [
+        {'record_number': record_number, 'pdf_link': entry['url'], 'num_pages': entry['num_pages']}
+        for record_number, entry in entries.items()
+    ]
+    for record in db.insert('record', rows):
+        ledger.add_record(record['record_number'], record['id'], record['pdf_link'], record['num_pages'])
+        ledger.queue_pipeline(record['record_number'], record['num_pages'])
+    print(f"Added {len(rows)} new records")
+
+
+def replace_records(entries: Dict[str, dict], database: Dict[str, dict]):
+    """Point changed records at their new PDF and drop everything derived from the old one"""
+    for record_number, entry in entries.items():
+        record_id = database[record_number]['id']
+        with timed('db_write', table='page', record=record_number):
+            supabase.table('page').delete().eq('parent_record_id', record_id).execute()
+        with timed('db_write', table='record', record=record_number):
+            supabase.table('record').update({
+                'pdf_link': entry['url'],
+                'num_pages': entry['num_pages'],
+                'in_anything_llm': False,
+            }).eq('id', record_id).execute()
+
+        corpus_file = Path('ocr-text', f"{record_number}.txt")
+        if corpus_file.exists():
+            corpus_file.unlink()
+        ledger.forget(record_number)
+        ledger.add_record(record_number, record_id, entry['url'], entry['num_pages'])
+        ledger.queue_pipeline(record_number, entry['num_pages'])
+        print(f"Replaced {record_number} with {entry['url']}")
+
+
+def process_delta(record_numbers: List[str]):
+    """OCR, build the corpus files for and ingest just the synced records"""
+    ocr = importlib.import_module('gemini-page-ocr')
+    for record_number in sorted(record_numbers):
+        ocr.process_pdf(os.path.join(PDF_DIR, f"{record_number}.pdf"))
+    # Both of these only pick up records the ledger has pending
+    importlib.import_module('make-pages').save_concatenated_pages()
+    importlib.import_module('upload-to-anything-llm').upload_pending_files()
+
+
+def sync(dry_run: bool = False, verify: bool = False, force: bool = False, process: bool = True):
+    manifest = releases.load_manifest()
+    known = manifest['records']
+    # {record_number: url} of downloads that failed last time. The listing's
+    # validators were saved regardless, so these are retried even when it's unchanged.
+    failed = manifest.setdefault('failed', {})
+    listing = {} if force else dict(manifest['listing'])
+
+    with timed('scrape', url=releases.LISTING_URL):
+        html = releases.fetch_listing(listing)
+    if html is None:
+        if not verify and not failed:
+            print("Listing unchanged since the last sync")
+            return
+        links = {record_number: entry['url'] for record_number, entry in known.items()}
+        links.update(failed)
+        if failed:
+            print(f"Listing unchanged, retrying {len(failed)} records that failed last time")
+    else:
+        links = releases.parse_listing(html)
+        if not links:
+            print(f"No PDF links found on {releases.LISTING_URL}, has the page layout changed?")
+            return
+    print(f"Listing has {len(links)} records across "
+          f"{len({releases.release_of(url) for url in links.values()})} releases")
+
+    candidates = {record_number for record_number, url in links.items()
+                  if known.get(record_number, {}).get('url') != url}
+    replaced = set(verify_files(links, known)) if verify else set()
+    # Failed replacements keep the URL the manifest already has, so they count as replaced
+    replaced |= {record_number for record_number, url in failed.items() if links.get(record_number) == url}
+    candidates |= replaced
+    withdrawn = set(known) - set(links)
+    if withdrawn:
+        print(f"{len(withdrawn)} records in the manifest are no longer listed, leaving them alone")
+
+    if not candidates:
+        print("No new or changed records")
+        if not dry_run:
+            manifest['listing'] = listing
+            manifest['failed'] = {}
+            releases.save_manifest(manifest)
+        return
+
+    database = fetch_records()
+    new, changed = [], []
+    for record_number in sorted(candidates):
+        url = links[record_number]
+        record = database.get(record_number)
+        if record is None:
+            new.append(record_number)
+        elif record_number in replaced or \
+                releases.release_of(record.get('pdf_link') or '') not in (None, releases.release_of(url)):
+            # Moved to another release folder, or replaced in place (--verify).
+            # Links without a release folder are local paths repair.py fixes up.
+            changed.append(record_number)
+        else:
+            # Already in the database, the manifest just hadn't caught up
+            known[record_number] = releases.file_info(url, {})
+    print(f"{len(new)} new records, {len(changed)} changed, "
+          f"{len(candidates) - len(new) - len(changed)} already in the database")
+
+    if dry_run:
+        for record_number in new:
+            print(f"  new      {links[record_number]}")
+        for record_number in changed:
+            print(f"  changed  {database[record_number].get('pdf_link')} -> {links[record_number]}")
+        print("Dry run, nothing downloaded or written")
+        return
+
+    os.makedirs(PDF_DIR, exist_ok=True)
+    downloaded = {}
+
+    def fetch(record_number):
+        try:
+            return record_number, download(links[record_number])
+        except Exception as e:
+            print(f"Error downloading {links[record_number]}: {str(e)}")
+            return record_number, None
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        metrics.queue_depth('download', len(new) + len(changed))
+        for record_number, entry in executor.map(fetch, new + changed):
+            if entry:
+                downloaded[record_number] = entry
+    print(f"Downloaded {len(downloaded)} of {len(new) + len(changed)} PDFs")
+
+    add_new_records({rn: downloaded[rn] for rn in new if rn in downloaded})
+    replace_records({rn: downloaded[rn] for rn in changed if rn in downloaded}, database)
+
+    for record_number, entry in downloaded.items():
+        known[record_number] = {key: value for key, value in entry.items() if key != 'num_pages'}
+    manifest['failed'] = {record_number: links[record_number]
+                          for record_number in new + changed if record_number not in downloaded}
+    if manifest['failed']:
+        print(f"{len(manifest['failed'])} downloads failed, they'll be retried on the next sync")
+    manifest['listing'] = listing
+    releases.save_manifest(manifest)
+    print(f"Saved manifest to {releases.MANIFEST_PATH}")
+
+    if process and downloaded:
+        process_delta(list(downloaded))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download and process only new or changed NARA records")
+    parser.add_argument('--dry-run', action='store_true', help="print the delta without downloading anything")
+    parser.add_argument('--verify', action='store_true',
+                        help="HEAD every listed file to catch changes under an unchanged URL")
+    parser.add_argument('--force', action='store_true', help="re-read the listing even if it looks unchanged")
+    parser.add_argument('--no-process', action='store_true', help="stop after downloading")
+    args = parser.parse_args()
+    metrics.start()
+    sync(args.dry_run, args.verify, args.force, not args.no_process)
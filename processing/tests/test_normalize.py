@@ -0,0 +1,47 @@
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROCESSING = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROCESSING))
+
+from normalize import normalize  # noqa: E402
+
+FIXTURES = json.loads(Path(__file__).with_name('normalize-fixtures.json').read_text(encoding='utf-8'))
+NORMALIZE_JS = PROCESSING.parent / 'frontend' / 'scripts' / 'normalize.js'
+
+# Reads the fixture texts as JSON on stdin and prints normalizeText() of each
+NODE_SCRIPT = f"""
+import {{ normalizeText }} from {json.dumps(NORMALIZE_JS.as_uri())};
+let input = '';
+process.stdin.setEncoding('utf8');
+process.stdin.on('data', (chunk) => (input += chunk));
+process.stdin.on('end', () => console.log(JSON.stringify(JSON.parse(input).map(normalizeText))));
+"""
+
+
+@pytest.fixture(scope='module')
+def js_outputs():
+    if not shutil.which('node'):
+        pytest.skip("node is not installed")
+    result = subprocess.run(
+        ['node', '--input-type=module', '-e', NODE_SCRIPT],
+        input=json.dumps([fixture['text'] for fixture in FIXTURES]),
+        capture_output=True, text=True, encoding='utf-8', check=True,
+    )
+    return dict(zip((fixture['name'] for fixture in FIXTURES), json.loads(result.stdout)))
+
+
+@pytest.mark.parametrize('fixture', FIXTURES, ids=[fixture['name'] for fixture in FIXTURES])
+def test_python_and_js_agree(fixture, js_outputs):
+    assert normalize(fixture['text'])[0] == js_outputs[fixture['name']]
+
+
+@pytest.mark.parametrize('fixture', [f for f in FIXTURES if 'expected' in f],
+                         ids=[f['name'] for f in FIXTURES if 'expected' in f])
+def test_expected_output(fixture):
+    assert normalize(fixture['text'])[0] == fixture['expected']
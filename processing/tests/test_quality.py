@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import quality  # noqa: E402
+
+
+def feature(chars: int, ink, words: int = 400) -> dict:
+    return {'id': 'page', 'chars': chars, 'words': words, 'dictionary': 1.0, 'entropy': 4.2,
+            'fences': 0.0, 'repeats': 0.0, 'ink': ink}
+
+
+def test_long_text_on_a_zero_ink_page_gets_the_full_length_penalty():
+    penalties = quality.score(feature(3000, 0.0), expected_ratio=20000.0)
+    assert penalties['length'] == 1.0
+    assert penalties['score'] == quality.WEIGHTS['length']
+
+
+def test_text_matching_the_ink_costs_nothing():
+    assert quality.score(feature(2000, 0.1), expected_ratio=20000.0)['length'] == 0.0
+
+
+def test_pages_without_an_ink_estimate_skip_the_length_check():
+    assert 'length' not in quality.score(feature(3000, None), expected_ratio=20000.0)
@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import render  # noqa: E402
+
+
+def test_a_speck_on_a_blank_page_gets_the_minimum_dpi():
+    assert render.choose_ocr_dpi(2.0, 0.002) == render.MIN_OCR_DPI
+
+
+def test_ordinary_typescript_renders_below_the_maximum():
+    # Line bands of 5-6px at the probe, like the bench corpus's typescript
+    assert render.choose_ocr_dpi(5.0, 0.08) < render.MAX_OCR_DPI
+    assert render.choose_ocr_dpi(6.0, 0.08) < render.MAX_OCR_DPI
+
+
+def test_dense_pages_and_pictures_get_the_maximum_dpi():
+    assert render.choose_ocr_dpi(5.0, render.DENSE_PAGE) == render.MAX_OCR_DPI
+    assert render.choose_ocr_dpi(0.0, 0.1) == render.MAX_OCR_DPI
@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfWriter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import repair  # noqa: E402
+from releases import release_url  # noqa: E402
+
+URL = 'https://www.archives.gov/files/research/jfk/releases/2025/0318/'
+
+
+@pytest.fixture
+def pdf_dir(tmp_path, monkeypatch):
+    """A PDF_DIR holding 104-10001-10001.pdf, three pages long"""
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(612, 792)
+    with open(tmp_path / '104-10001-10001.pdf', 'wb') as f:
+        writer.write(f)
+    monkeypatch.setattr(repair, 'PDF_DIR', str(tmp_path))
+    repair.pdf_page_count.cache_clear()
+    yield tmp_path
+    repair.pdf_page_count.cache_clear()
+
+
+def test_record_fixes_fill_in_missing_columns(pdf_dir):
+    records = [{'id': 'a', 'record_number': None, 'pdf_link': URL + '104-10001-10001.pdf', 'num_pages': None}]
+    fixes = repair.plan_record_fixes(records, {'104-10001-10001.pdf'})
+    assert fixes == {'a': {'record_number': '104-10001-10001', 'num_pages': 3}}
+
+
+def test_record_fixes_replace_local_paths(pdf_dir):
+    records = [
+        {'id': 'a', 'record_number': '104-10001-10001', 'pdf_link': 'downloaded-pdfs/104-10001-10001.pdf', 'num_pages': 3},
+        {'id': 'b', 'record_number': '104-10002-10002', 'pdf_link': 'downloaded-pdfs/104-10002-10002.pdf', 'num_pages': 1},
+    ]
+    fixes = repair.plan_record_fixes(records, {'104-10001-10001.pdf'},
+                                     {'104-10001-10001': URL + '104-10001-10001.pdf'})
+    assert fixes == {
+        'a': {'pdf_link': URL + '104-10001-10001.pdf'},
+        'b': {'pdf_link': release_url('104-10002-10002.pdf')},
+    }
+
+
+def test_record_fixes_leave_good_and_linkless_records_alone(pdf_dir):
+    records = [
+        {'id': 'a', 'record_number': '104-10001-10001', 'pdf_link': URL + '104-10001-10001.pdf', 'num_pages': 3},
+        {'id': 'b', 'record_number': None, 'pdf_link': None, 'num_pages': None},
+    ]
+    assert repair.plan_record_fixes(records, {'104-10001-10001.pdf'}) == {}
+
+
+def test_page_fixes_take_the_number_from_the_public_id():
+    records = {'a': {'id': 'a', 'pdf_link': URL + '104-10001-10001.pdf', 'num_pages': 3}}
+    pages = [
+        {'id': 'p1', 'parent_record_id': 'a', 'page_number': None, 'public_id': 'jfk/104-10001-10001_page_2'},
+        {'id': 'p2', 'parent_record_id': 'a', 'page_number': None, 'public_id': 'jfk/104-99999-99999_page_1'},
+        {'id': 'p3', 'parent_record_id': 'a', 'page_number': None, 'public_id': None},
+        {'id': 'p4', 'parent_record_id': 'a', 'page_number': 1, 'public_id': 'jfk/104-10001-10001_page_1'},
+    ]
+    assert repair.plan_page_fixes(pages, records) == {'p1': {'page_number': 2}}
+
+
+def test_page_fixes_skip_orphans_and_records_without_a_link():
+    records = {'a': {'id': 'a', 'pdf_link': None, 'num_pages': None}}
+    pages = [
+        {'id': 'p1', 'parent_record_id': 'a', 'page_number': None, 'public_id': 'jfk/104-10001-10001_page_2'},
+        {'id': 'p2', 'parent_record_id': 'gone', 'page_number': None, 'public_id': 'jfk/104-10001-10001_page_2'},
+    ]
+    assert repair.plan_page_fixes(pages, records) == {}
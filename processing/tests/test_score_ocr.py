@@ -0,0 +1,62 @@
+import importlib
+import io
+import random
+import sys
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import quality  # noqa: E402
+from bench.mocks import WORDS  # noqa: E402
+
+score_ocr = importlib.import_module('score-ocr')
+
+
+def typed_page(rng: random.Random, lines: int) -> (Image.Image, str):
+    """A letter page at 300 DPI with `lines` lines of typing, and its text"""
+    page = Image.new('L', (2550, 3300), 240)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=42)
+    text = []
+    for line in range(lines):
+        words = ' '.join(rng.choices(WORDS, k=rng.randint(6, 10))).upper()
+        draw.text((150, 150 + line * 75), words, fill=30, font=font)
+        text.append(words)
+    return page, '\n'.join(text)
+
+
+def upload_row(page_id: str, image: Image.Image, text: str) -> dict:
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, 'JPEG', quality=85)
+    return {'id': page_id, 'ocr_result': text, 'ink_bytes': str(buffer.tell()),
+            'ink_width': str(image.width), 'ink_height': str(image.height)}
+
+
+def test_the_same_page_scores_the_same_at_150_and_300_dpi():
+    rng = random.Random(0)
+    pages = []
+    for index in range(40):
+        image, text = typed_page(rng, 0 if index < 4 else rng.randint(3, 40))
+        pages.append(upload_row(f"{index}-300", image, text))
+        pages.append(upload_row(f"{index}-150", image.resize((1275, 1650), Image.LANCZOS), text))
+
+    score_ocr.ink_estimates(pages)
+    assert {page['ink_group'] for page in pages} == {150, 300}
+
+    vocabulary = frozenset(word.lower() for word in WORDS)
+    features = quality.page_features(pages, vocabulary)
+    pages_by_id = {page['id']: page for page in pages}
+    ratios = score_ocr.length_ratios(features, pages_by_id)
+    expected = {}
+    length = {}
+    for feature in features:
+        ratio = ratios[pages_by_id[feature['id']]['ink_group']]
+        expected[feature['id']] = ratio * feature['ink']
+        length[feature['id']] = quality.score(feature, ratio)['length']
+    for index in range(40):
+        high, low = f"{index}-300", f"{index}-150"
+        # One baseline for both resolutions expects ~1.8x the text at 150 DPI
+        assert abs(expected[low] - expected[high]) <= 0.1 * expected[high] + 1, index
+        assert abs(length[low] - length[high]) < 0.02, index
@@ -1,43 +1,30 @@
 import os
 from pathlib import Path
-from supabase import create_client, Client
-from dotenv import load_dotenv
 import requests
-import time
-
-# Load environment variables and initialize Supabase client
-load_dotenv()
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+from clients import supabase, ledger
+from metrics import metrics, timed
+from ledger import INGEST, PENDING
 
 IS_PRODUCTION = not os.getenv('IS_DEV', 'false').lower() == 'true'
-BASE_URL ="https://anythingllm-production-047a.up.railway.app"
+BASE_URL = os.getenv("ANYTHING_LLM_URL", "https://anythingllm-production-047a.up.railway.app")
 ANYTHING_LLM_AUTH = os.getenv('ANYTHING_LLM_AUTHORIZATION')
 
 def upload_pending_files():
-    # Add debug logging for the query
-    print("Fetching records from Supabase...")
-    records = supabase.table('record')\
-        .select('*')\
-        .is_('in_anything_llm', 'null')\
-        .execute()
+    records = ledger.find(INGEST, (PENDING,))
 
-    if not records.data:
+    if not records:
         print("No records found to process")
         return
 
-    print(f"Found {len(records.data)} records to process")
+    print(f"Found {len(records)} records to process")
     ocr_dir = Path("ocr-text")
     
-    for record in records.data:
-        # Debug print the record
-        print(f"\nProcessing record: {record.get('id')}")
-        record_number = record.get('record_number')
+    for record_number, _ in records:
+        print(f"\nProcessing record: {record_number}")
+        record = ledger.get_record(record_number)
         
-        if not record_number:
-            print(f"Skipping record {record.get('id')}: record_number is None")
+        if not record or not record['record_id']:
+            print(f"Skipping record {record_number}: not in the ledger's record table")
             continue
             
         try:
@@ -53,13 +40,17 @@ def upload_pending_files():
                     'file': (filename, open(file_path, 'rb'), 'text/plain')
                 }
                 
-                upload_response = requests.post(
-                    f"{BASE_URL}/api/v1/document/upload",
-                    files=files,
-                    headers={
-                        'Authorization': f'Bearer {ANYTHING_LLM_AUTH}'
-                    }
-                )
+                with timed('ingest', record=record_number, step='upload') as span:
+                    span['bytes'] = file_path.stat().st_size
+                    upload_response = requests.post(
+                        f"{BASE_URL}/api/v1/document/upload",
+                        files=files,
+                        headers={
+                            'Authorization': f'Bearer {ANYTHING_LLM_AUTH}'
+                        }
+                    )
+                    if upload_response.status_code != 200:
+                        span['error'] = upload_response.status_code
                 if upload_response.status_code == 200:
                     try:
                         upload_result = upload_response.json()
@@ -68,25 +59,33 @@ def upload_pending_files():
                     except (ValueError, KeyError, IndexError):
                         continue
                     
+                    # A re-ingested record (new release, recovered pages) replaces its old document
+                    # rather than leaving both versions in the workspace
                     update_payload = {
                         "adds": [document_path],
-                        "deletes": []
+                        "deletes": [record['document']] if record.get('document') else []
                     }
                     
-                    embeddings_response = requests.post(
-                        f"{BASE_URL}/api/v1/workspace/jfk/update-embeddings",
-                        json=update_payload,
-                        headers={
-                            'Authorization': f'Bearer {ANYTHING_LLM_AUTH}',
-                            'Content-Type': 'application/json'
-                        }
-                    )
+                    with timed('ingest', record=record_number, step='embed') as span:
+                        embeddings_response = requests.post(
+                            f"{BASE_URL}/api/v1/workspace/jfk/update-embeddings",
+                            json=update_payload,
+                            headers={
+                                'Authorization': f'Bearer {ANYTHING_LLM_AUTH}',
+                                'Content-Type': 'application/json'
+                            }
+                        )
+                        if embeddings_response.status_code != 200:
+                            span['error'] = embeddings_response.status_code
                     
                     if embeddings_response.status_code == 200:
-                        supabase.table('record')\
-                            .update({'in_anything_llm': True})\
-                            .eq('id', record['id'])\
-                            .execute()
+                        with timed('db_write', record=record_number):
+                            supabase.table('record')\
+                                .update({'in_anything_llm': True})\
+                                .eq('id', record['record_id'])\
+                                .execute()
+                        ledger.set_document(record_number, document_path)
+                        ledger.done(record_number, INGEST)
                         print(f"Successfully uploaded and embedded {filename}")
                     else:
                         print(f"Failed to upload and embed {filename}")
@@ -97,7 +96,8 @@ def upload_pending_files():
                 print(f"Failed to upload and embed {filename}")
                 
         except Exception as e:
-            print(f"Failed to process record {record.get('id')}: {e}")
+            print(f"Failed to process record {record_number}: {e}")
 
 if __name__ == "__main__":
+    metrics.start()
     upload_pending_files()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import threading
+from PIL import Image
+from metrics import timed
+from clients import cloudinary_uploader
+
+# Maximum number of Cloudinary uploads in flight from this process
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 10))
+_upload_slots = threading.BoundedSemaphore(UPLOAD_WORKERS)
+
+
+def upload_page_image(image: Image, filename: str) -> dict:
+    """Upload image to Cloudinary"""
+    thread_name = threading.current_thread().name
+    print(f"{thread_name}: Uploading {filename} to Cloudinary...")
+    
+    # Create a temporary file
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
+        rgb_image = None
+        try:
+            with timed('encode', filename=filename) as span:
+                # Convert to RGB and save as JPEG with compression
+                rgb_image = image.convert('RGB')
+                rgb_image.save(tmp_file.name, 'JPEG', quality=85, optimize=True)
+                
+                # Check file size and reduce quality if needed
+                quality = 85
+                while os.path.getsize(tmp_file.name) > 10_000_000:  # 10MB limit
+                    quality = int(quality * 0.9)  # Reduce quality by 10%
+                    if quality < 20:  # Set minimum quality threshold
+                        print(f"{thread_name}: Could not reduce file size enough")
+                        span['error'] = 'too large'
+                        return None
+                    rgb_image.save(tmp_file.name, 'JPEG', quality=quality, optimize=True)
+                span['bytes'] = os.path.getsize(tmp_file.name)
+            
+            # Upload the temporary file to Cloudinary
+            with _upload_slots, timed('upload', filename=filename, bytes=span['bytes']):
+                result = cloudinary_uploader.upload(tmp_file.name, public_id=filename)
+            print(f"{thread_name}: Cloudinary upload result: {result}")
+            
+            return result
+        finally:
+            # Clean up
+            if rgb_image is not None:
+                rgb_image.close()
+            # Remove temporary file
+            if os.path.exists(tmp_file.name):
+                os.unlink(tmp_file.name)